@@ -0,0 +1,134 @@
+""" Monthly aggregation of the sentiment and complexity of many groups of quotes in one pass """
+
+# imports
+
+import numpy as np
+import pandas as pd
+
+# global variables
+
+measures = ['sentiment_score', 'complexity']
+
+group_columns = ['political_party', 'nationality', 'gender', 'speaker']
+
+# helpers
+
+def _month_codes(df):
+    """Function giving the month code of each quote and the months (PeriodIndex), from the date or else the quoteID"""
+
+    if 'date' in df:
+        codes, months = pd.factorize(pd.to_datetime(df.date).dt.to_period('M'), sort=True)
+        return codes, pd.PeriodIndex(months, freq='M')
+
+    # quoteIDs start with the date of the quote (2020-01-16-000088), only the unique months are parsed
+    codes, months = pd.factorize(df.quoteID.str.slice(0, 7), sort=True)
+
+    return codes, pd.PeriodIndex(months, freq='M')
+
+def _group_codes(values):
+    """Function giving the code of each value and the groups (the categories for a categorical column)"""
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+
+    codes, groups = pd.factorize(values)
+
+    return codes, pd.Index(groups)
+
+# aggregation
+
+class MonthlyCube:
+    """Count, sum and sum of squares of the measures per (dimension, group, month), see monthly_cube
+
+    The sums allow to get the mean and variance of a group or of several groups together (e.g. the
+    countries of a continent) without going back to the quotes"""
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    @property
+    def dimensions(self):
+        return list(self.frame.index.unique('dimension'))
+
+    def groups(self, dimension):
+        """Function giving the groups of the dimension"""
+
+        return list(self.frame.loc[dimension].index.unique('group'))
+
+    def stats(self, measure, dimension='all', groups=None, year=None):
+        """Function giving the count, mean and variance (ddof=1) of the measure per month for the groups
+
+        groups is one group or a list of groups of the dimension (taken together), all of them if None"""
+
+        frame = self.frame.loc[dimension]
+        if groups is not None:
+            if isinstance(groups, str) or not np.iterable(groups):
+                groups = [groups]
+            frame = frame[frame.index.get_level_values('group').isin(groups)]
+
+        sums = frame[[f'{measure}_count', f'{measure}_sum', f'{measure}_squares']].groupby(level='month').sum()
+        sums.columns = ['count', 'sum', 'squares']
+        sums = sums[sums['count'] > 0]
+        if year is not None:
+            sums = sums[sums.index.year == year]
+
+        count = sums['count']
+        mean = sums['sum'] / count
+        # variance from the sums, nan for a single quote as pandas
+        var = ((sums['squares'] - sums['sum'] * mean) / (count - 1)).where(count > 1).clip(lower=0)
+
+        return pd.DataFrame({'count': count.astype(np.int64), 'mean': mean, 'var': var})
+
+    def mean(self, measure, dimension='all', groups=None, year=None):
+        """Function giving the mean of the measure per month for the groups (see stats)"""
+
+        return self.stats(measure, dimension, groups, year)['mean'].rename(measure)
+
+    def __repr__(self):
+        return f'MonthlyCube({len(self.frame)} cells, dimensions {self.dimensions})'
+
+def monthly_cube(df, groups=group_columns, measures=measures):
+    """Function aggregating the measures of the quotes per month for all the quotes ('all' dimension) and
+    for each group of the group columns, in one pass
+
+    The months are parsed once from the dates, and the (dimension, group, month) cells of all the group
+    columns are accumulated together with np.bincount"""
+
+    n = len(df)
+    month_codes, months = _month_codes(df)
+    n_months = max(len(months), 1)
+
+    dimensions = [('all', np.zeros(n, dtype=np.int64), pd.Index(['all']))]
+    dimensions += [(column, *_group_codes(df[column])) for column in groups if column in df]
+
+    # one key per (quote, dimension): offset of the dimension + group * n_months + month
+    keys, cells, offset = [], [], 0
+    for name, codes, uniques in dimensions:
+        valid = (codes >= 0) & (month_codes >= 0)
+        keys.append(np.where(valid, offset + codes.astype(np.int64) * n_months + month_codes, -1))
+        cells.append((name, uniques, offset))
+        offset += len(uniques) * n_months
+    keys = np.concatenate(keys)
+
+    columns = {}
+    for measure in measures:
+        values = np.tile(df[measure].to_numpy(dtype=np.float64), len(dimensions))
+        valid = (keys >= 0) & ~np.isnan(values)
+        columns[f'{measure}_count'] = np.bincount(keys[valid], minlength=offset)
+        columns[f'{measure}_sum'] = np.bincount(keys[valid], weights=values[valid], minlength=offset)
+        columns[f'{measure}_squares'] = np.bincount(keys[valid], weights=values[valid] ** 2, minlength=offset)
+
+    # index of the non empty cells
+    used = np.flatnonzero(np.bincount(keys[keys >= 0], minlength=offset))
+    starts = np.array([start for _, _, start in cells])
+    dimension = np.searchsorted(starts, used, side='right') - 1
+    local = used - starts[dimension]
+    group = np.concatenate([np.asarray(uniques, dtype=object) for _, uniques, _ in cells])
+    group_offsets = np.cumsum([0] + [len(uniques) for _, uniques, _ in cells])
+
+    index = pd.MultiIndex.from_arrays([np.array([name for name, _, _ in cells], dtype=object)[dimension],
+                                       group[group_offsets[dimension] + local // n_months],
+                                       months[local % n_months]], names=['dimension', 'group', 'month'])
+    frame = pd.DataFrame({column: values[used] for column, values in columns.items()}, index=index)
+
+    return MonthlyCube(frame)
@@ -0,0 +1,148 @@
+""" Alignment of the quotes sentiment of speaker groups with the storm event damages on a common time grid
+
+    panel = align_quotes_damages(df_speakers, load_storm_events(), groups={'Greta': select_speaker(df_speakers, 'greta thunberg')})
+    plot_damages_weighted_sentiment(panel.damages_sum('M'), panel.scores_mean('all', 'M'))
+    plot_global_greta_sentiment_damages(panel.yearly('sentiment_mean', 'all'), panel.yearly('sentiment_mean', 'Greta'),
+                                        panel.yearly('DAMAGE_PROPERTY'))
+"""
+
+# imports
+
+import numpy as np
+import pandas as pd
+
+# global variables
+
+# columns summed when going to a coarser time grid, the means being computed from them
+quote_columns = ['quotes', 'scored', 'occurrences', 'sentiment_sum', 'weighted_sentiment_sum']
+
+damage_columns = ['events', 'DAMAGE_PROPERTY']
+
+_frequencies = {'D': 0, 'W': 1, 'M': 2}
+
+# helpers
+
+def _days(dates):
+    return pd.DatetimeIndex(pd.to_datetime(dates).values.astype('datetime64[D]'))
+
+def _period_starts(dates, freq):
+    """Function giving the first day of the day / week (starting on monday) / month of each date"""
+
+    return pd.DatetimeIndex(dates).to_period(freq).start_time
+
+def _daily_quotes(df):
+    """Function summing the quotes, their occurrences and their (weighted) sentiment per day"""
+
+    score = df.sentiment_score.to_numpy(dtype=np.float64)
+    scored = ~np.isnan(score)
+    occurrences = df.numOccurrences.to_numpy(dtype=np.float64) if 'numOccurrences' in df else np.ones(len(df))
+
+    daily = pd.DataFrame({'date': _days(df.date), 'quotes': 1, 'scored': scored.astype(np.int64),
+                          'occurrences': np.where(scored, occurrences, 0.),
+                          'sentiment_sum': np.where(scored, score, 0.),
+                          'weighted_sentiment_sum': np.where(scored, score * occurrences, 0.)})
+
+    return daily.groupby('date').sum()
+
+def _daily_damages(events):
+    """Function summing the events and their property damages per day (per month without BEGIN_DATE)"""
+
+    if 'BEGIN_DATE' in events:
+        dates, freq = _days(events.BEGIN_DATE), 'D'
+    else:
+        month = events.MONTH if 'MONTH' in events else events.MONTH_NAME
+        dates, freq = pd.to_datetime(pd.DataFrame({'year': events.YEAR, 'month': month, 'day': 1})), 'M'
+
+    daily = pd.DataFrame({'date': dates, 'events': 1,
+                          'DAMAGE_PROPERTY': events.DAMAGE_PROPERTY.to_numpy(dtype=np.float64)})
+
+    return daily.groupby('date').sum(), freq
+
+# panel
+
+class TimePanel:
+    """Daily sums of the quotes of each speaker group and of the storm event damages, from which the panel of
+    any time grid (at) is computed by summing the days, without going back to the quotes and the events"""
+
+    def __init__(self, quotes, damages, damage_freq='D'):
+        # (group, date) sums of the quotes and date sums of the damages
+        self.quotes = quotes
+        self.damages = damages
+        self.damage_freq = damage_freq
+
+    @property
+    def groups(self):
+        return list(self.quotes.index.unique('group'))
+
+    def at(self, freq='M', start=None, end=None):
+        """Function giving the panel of the groups on the grid of freq ('D', 'W' or 'M'): quotes, occurrences,
+        mean and weighted (by occurrences) sentiment of each group, and events and damages of each period
+
+        The grid goes from start to end (the first and last days of the quotes and the events by default), the
+        periods without quotes having no mean and the periods without events no damages"""
+
+        if _frequencies[freq] < _frequencies[self.damage_freq]:
+            raise ValueError(f'damages are only known per {self.damage_freq}, not per {freq}')
+
+        days = self.quotes.index.get_level_values('date').append(self.damages.index)
+        start = pd.Timestamp(start) if start is not None else days.min()
+        end = pd.Timestamp(end) if end is not None else days.max()
+        grid = pd.period_range(start, end, freq=freq).start_time
+
+        # sums per period on the sorted (group, date) grid
+        quotes = self.quotes.groupby([self.quotes.index.get_level_values('group'),
+                                      _period_starts(self.quotes.index.get_level_values('date'), freq)]).sum()
+        quotes = quotes.reindex(pd.MultiIndex.from_product([self.groups, grid], names=['group', 'date']), fill_value=0)
+        damages = self.damages.groupby(_period_starts(self.damages.index, freq)).sum().reindex(grid, fill_value=0)
+
+        panel = quotes.join(damages.rename_axis('date'), on='date')
+        panel['sentiment_mean'] = panel.sentiment_sum / panel.scored.where(panel.scored > 0)
+        panel['weighted_sentiment'] = panel.weighted_sentiment_sum / panel.occurrences.where(panel.occurrences > 0)
+
+        return panel
+
+    def group(self, group, freq='M', start=None, end=None):
+        """Function giving the panel of one group, indexed by date"""
+
+        return self.at(freq, start, end).xs(group, level='group')
+
+    def damages_sum(self, freq='M', start=None, end=None):
+        """Function giving the damages of each period (date, DAMAGE_PROPERTY), as the damages_sum of the notebook"""
+
+        return self.group(self.groups[0], freq, start, end)[['DAMAGE_PROPERTY']].reset_index()
+
+    def scores_mean(self, group='all', freq='M', start=None, end=None):
+        """Function giving the mean and weighted sentiment of the group in each period (date, sentiment_mean,
+        weighted_sentiment), as the scores_mean of the notebook"""
+
+        return self.group(group, freq, start, end)[['sentiment_mean', 'weighted_sentiment']].reset_index()
+
+    def yearly(self, column, group='all'):
+        """Function giving a monthly column of the group with the months (1 to 12) as rows and the years as
+        columns, as the natural and mean_sentiment_score_* inputs of the natural disasters plots"""
+
+        series = self.group(group, 'M')[column]
+
+        return series.groupby([series.index.month, series.index.year]).sum(min_count=1).unstack().rename_axis(index=None, columns=None)
+
+    def __repr__(self):
+        return f'TimePanel({len(self.groups)} groups, {len(self.quotes)} group days, {len(self.damages)} damage days)'
+
+def align_quotes_damages(quotes, events, groups=None):
+    """Function building the TimePanel of the quotes (with date, sentiment_score and numOccurrences) and the storm
+    events (load_storm_events, or with YEAR and MONTH for monthly damages only)
+
+    The quotes of all the speakers form the 'all' group, groups adds named groups: a dict of label to a df of
+    quotes or a boolean mask of quotes, or a column of the quotes whose values are the groups"""
+
+    selections = {'all': quotes}
+    if isinstance(groups, str):
+        selections.update({value: df for value, df in quotes.groupby(groups, observed=True)})
+    elif groups is not None:
+        selections.update({label: quotes[selection] if isinstance(selection, (pd.Series, np.ndarray)) else selection
+                           for label, selection in groups.items()})
+
+    daily = pd.concat({label: _daily_quotes(df) for label, df in selections.items()}, names=['group', 'date'])
+    damages, damage_freq = _daily_damages(events)
+
+    return TimePanel(daily.sort_index(), damages, damage_freq)
@@ -0,0 +1,123 @@
+""" Benchmarks of the helpers on synthetic data shaped like the project datasets """
+
+# imports
+
+import os
+import bz2
+import json
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+import textstat
+from .matching import KeywordMatcher
+from . import readability
+
+# global variables
+
+climate_words = ['climate', 'change', 'global', 'warming', 'greenhouse', 'emissions', 'pollution', 'carbon', 'unprecedented',
+                 'catastrophic', 'biodiversity', 'sustainability', 'renewable', 'temperature', 'scientists', 'generation']
+
+filler_words = ['the', 'we', 'need', 'to', 'people', 'government', 'said', 'economy', 'jobs', 'year', 'country', 'future',
+                'market', 'energy', 'policy', 'children', 'world', 'important', 'believe', 'change', 'new', 'plan', 'tax']
+
+# synthetic data
+
+def make_synthetic_quotebank(path, words, n_quotes=200000, match_rate=0.01, seed=0):
+    """Function writing a bz2 json lines file with the columns of Quotebank, match_rate of the quotes containing one of the words"""
+    
+    rng = np.random.default_rng(seed)
+    
+    with bz2.open(path, 'wt', encoding='utf-8') as f:
+        for i in range(n_quotes):
+            tokens = rng.choice(filler_words, size=rng.integers(5, 40)).tolist()
+            if rng.random() < match_rate:
+                tokens.insert(rng.integers(len(tokens)), str(rng.choice(words)).upper() if rng.random() < 0.5 else str(rng.choice(words)))
+            quote = {'quoteID': '2019-{:02d}-01-{:06d}'.format(rng.integers(1, 13), i),
+                     'quotation': ' '.join(tokens).capitalize() + '.',
+                     'speaker': 'Speaker {}'.format(rng.integers(1000)),
+                     'qids': ['Q{}'.format(rng.integers(1000))],
+                     'date': '2019-01-01 00:00:00',
+                     'numOccurrences': int(rng.integers(1, 10)),
+                     'probas': [['Speaker', '0.9'], ['None', '0.1']],
+                     'urls': ['http://example.com'],
+                     'phase': 'E'}
+            f.write(json.dumps(quote) + '\n')
+            
+    return path
+
+def make_synthetic_quotes(n_quotes=10000, seed=0):
+    """Function generating quote-like texts of one to a few sentences with punctuation"""
+    
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(filler_words + climate_words)
+    
+    quotes = []
+    for i in range(n_quotes):
+        sentences = []
+        for j in range(rng.integers(1, 4)):
+            tokens = rng.choice(vocabulary, size=rng.integers(3, 30)).tolist()
+            if rng.random() < 0.3:
+                tokens[rng.integers(len(tokens))] += ','
+            sentences.append(' '.join(tokens).capitalize() + str(rng.choice(['.', '!', '?'])))
+        quotes.append(' '.join(sentences))
+        
+    return quotes
+
+# benchmarks
+
+def benchmark_keyword_matching(words, n_quotes=200000, match_rate=0.01, chunksize=100000, path=None):
+    """Function comparing the regex str.contains filter with the KeywordMatcher on a synthetic Quotebank file"""
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        if path is None:
+            path = make_synthetic_quotebank(os.path.join(tmp, 'quotes-synthetic.json.bz2'), words, n_quotes, match_rate)
+        chunks = list(pd.read_json(path, lines=True, compression='bz2', chunksize=chunksize))
+        
+    n_quotes = sum(len(chunk) for chunk in chunks)
+    reg_query = "|".join(words)
+    matcher = KeywordMatcher(words)
+    
+    # previous path: case-insensitive alternation regex on every chunk
+    start = time.perf_counter()
+    regex_related = pd.concat([chunk[chunk.quotation.str.contains(reg_query, case=False, na=False)] for chunk in chunks])
+    regex_time = time.perf_counter() - start
+    
+    # matcher path, also computing the matched keywords
+    start = time.perf_counter()
+    matcher_related = pd.concat([matcher.filter(chunk) for chunk in chunks])
+    matcher_time = time.perf_counter() - start
+    
+    results = pd.DataFrame({'method': ['regex', 'matcher'],
+                            'seconds': [regex_time, matcher_time],
+                            'related_quotes': [len(regex_related), len(matcher_related)]})
+    results['quotes_per_second'] = n_quotes / results.seconds
+    results['same_quotes'] = regex_related.index.equals(matcher_related.index)
+    
+    return results
+
+
+def benchmark_complexity(n_quotes=10000, seed=0, quotes=None):
+    """Function comparing textstat.text_standard row by row with the batch readability engine
+    
+    The tolerance is 0: the engine is expected to give exactly the textstat grades, the mismatches are reported"""
+    
+    if quotes is None:
+        quotes = make_synthetic_quotes(n_quotes, seed)
+    
+    # previous path: one textstat call per quote
+    start = time.perf_counter()
+    textstat_grades = np.array([textstat.text_standard(quote, float_output=True) for quote in quotes])
+    textstat_time = time.perf_counter() - start
+    
+    # batch engine (syllable lookups cached across quotes)
+    start = time.perf_counter()
+    engine_grades = readability.text_standard(quotes)
+    engine_time = time.perf_counter() - start
+    
+    results = pd.DataFrame({'method': ['textstat', 'engine'], 'seconds': [textstat_time, engine_time]})
+    results['quotes_per_second'] = len(quotes) / results.seconds
+    results['mismatches'] = int((textstat_grades != engine_grades).sum())
+    results['max_abs_difference'] = np.abs(textstat_grades - engine_grades).max() if len(quotes) else 0.
+    
+    return results
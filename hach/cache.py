@@ -0,0 +1,103 @@
+""" Persistent cache of the per-quote text analysis results """
+
+# imports
+
+import hashlib
+import sqlite3
+
+# helpers
+
+class ResultCache:
+    """On-disk cache of a numeric result per quotation, stored in SQLite
+    
+    The key is a hash of the namespace (metric, model and version) and of the quotation text, so the same
+    quotation is only computed once across years, quote ids and notebook runs. Missing results are None,
+    while a stored NaN is given back as NaN. The hits and misses are counted to report the hit rate"""
+    
+    def __init__(self, path, namespace, commit_every=1000):
+        self.path = path
+        self.namespace = namespace
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, value REAL)')
+        
+    def _key(self, text):
+        return hashlib.blake2b(f'{self.namespace}\0{text}'.encode('utf-8'), digest_size=16).digest()
+    
+    def get_many(self, texts):
+        """Function giving the cached results of the texts (None when missing)"""
+        
+        keys = [self._key(text) for text in texts]
+        found = {}
+        # stay under the SQLite limit of query variables
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i+500]
+            query = 'SELECT key, value FROM results WHERE key IN ({})'.format(','.join('?' * len(batch)))
+            found.update(self._connection.execute(query, batch))
+            
+        results = []
+        for key in keys:
+            if key not in found:
+                results.append(None)
+            else:
+                # NULL is how SQLite stores NaN
+                results.append(float('nan') if found[key] is None else found[key])
+        
+        # each lookup counts, a quotation repeated in texts is as many hits or misses
+        hits = sum(key in found for key in keys)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        
+        return results
+    
+    def get(self, text):
+        """Function giving the cached result of a text (None when missing)"""
+        
+        return self.get_many([text])[0]
+    
+    def put_many(self, texts, values):
+        """Function storing the results of the texts"""
+        
+        rows = [(self._key(text), float(value)) for text, value in zip(texts, values)]
+        self._connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?)', rows)
+        self._pending += len(rows)
+        if self._pending >= self.commit_every:
+            self.commit()
+            
+    def put(self, text, value):
+        """Function storing the result of a text"""
+        
+        self.put_many([text], [value])
+        
+    def commit(self):
+        """Function writing the pending results to disk"""
+        
+        self._connection.commit()
+        self._pending = 0
+        
+    def close(self):
+        """Function writing the pending results and closing the database"""
+        
+        self.commit()
+        self._connection.close()
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+        
+    @property
+    def hit_rate(self):
+        """Proportion of the looked up texts found in the cache"""
+        
+        lookups = self.hits + self.misses
+        
+        return self.hits / lookups if lookups else 0.
+    
+    def __repr__(self):
+        return f'ResultCache({self.path!r}, {self.namespace!r}): {self.hits} hits, {self.misses} misses, hit rate {self.hit_rate:.1%}'
@@ -2,7 +2,7 @@
 import numpy as np
 import pandas as pd
 
-def replace_name(q, qids_to_name={}):
+def replace_name(q, qids_to_name):
     """Replace the aliases for one person by a unique name"""
     if 0 < len(q.qids):
         if q.qids[0] not in qids_to_name:
@@ -11,12 +11,37 @@ def replace_name(q, qids_to_name={}):
             q.speaker = qids_to_name[q.qids[0]]
     return q
 
-def clean_df(df):
-    """Cleans the dataset for speakers only for now"""
-    
+def first_qids(df):
+    """Gives the first QID of the speaker of each quote (NaN when the speaker has none)"""
+
+    return df['qids'].str[0]
+
+def speaker_names(dfs):
+    """Gives the canonical name of each speaker QID: the first name used for it in the dfs (in order)
+
+    Built once for all the years, so that a person has the same name in all of them"""
+
+    if isinstance(dfs, pd.DataFrame):
+        dfs = [dfs]
+
+    speakers = pd.concat([pd.DataFrame({'qid': first_qids(df), 'speaker': df['speaker']}) for df in dfs], ignore_index=True)
+    speakers = speakers[speakers['speaker'] != 'None']
+
+    return speakers.groupby('qid', sort=False)['speaker'].first().rename('name')
+
+def clean_df(df, names=None):
+    """Cleans the dataset for speakers only for now
+
+    names is the QID to canonical name mapping given by speaker_names (computed from df alone if None)"""
+
     # remove all the 'None' speakers
     df = df[df['speaker'] != 'None']
-    
-    df = df.apply(replace_name, axis=1)
-    
-    return df
\ No newline at end of file
+
+    if names is None:
+        names = speaker_names(df)
+
+    # replace the aliases for one person by a unique name
+    canonical = first_qids(df).map(names)
+    df = df.assign(speaker=canonical.fillna(df['speaker']))
+
+    return df
@@ -0,0 +1,143 @@
+""" Lagged cross-correlations between the storm damages and the quotes series of speaker groups, with permutation tests
+
+The correlation at lag k is the one of x[t] (e.g. the damages) with y[t + k] (e.g. the sentiment of a group), so a
+positive lag means that y follows x. All the groups and lags are computed at once with FFTs, and the permutations
+of x are tested in batches with numpy. Usage with a TimePanel (see alignment):
+
+    correlations = panel_correlations(panel, 'DAMAGE_PROPERTY', 'sentiment_mean', max_lag=6, n_permutations=10000)
+"""
+
+# imports
+
+import numpy as np
+import pandas as pd
+
+# helpers
+
+def _standardize(values):
+    """Function centering and scaling the series (last axis), the missing values being set to the mean (0)
+
+    The series without variance (constant, a single value or none) are all NaN, they have no correlation"""
+
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    count = np.maximum(valid.sum(axis=-1, keepdims=True), 1)
+
+    # constant when the largest and smallest values are equal (no warning for the empty series)
+    varies = np.where(valid, values, -np.inf).max(axis=-1, keepdims=True) > np.where(valid, values, np.inf).min(axis=-1, keepdims=True)
+
+    mean = np.where(valid, values, 0.).sum(axis=-1, keepdims=True) / count
+    centered = np.where(valid, values - mean, 0.)
+    std = np.sqrt((centered ** 2).sum(axis=-1, keepdims=True) / count)
+
+    return np.where(varies, centered / np.where(varies, std, 1.), np.nan)
+
+def _fft_size(n):
+    """Function giving the power of 2 FFT size for the linear (not circular) correlation of length n series"""
+
+    return 1 << int(np.ceil(np.log2(max(2 * n - 1, 1))))
+
+def _lagged_products(fx, fy, n, lags):
+    """Function giving the correlations at the lags from the FFTs of the standardized series (broadcast together)
+
+    The sums are divided by n (the standard ccf estimator, as statsmodels ccf with adjusted=False), which keeps the
+    correlations in [-1, 1] but shrinks them towards 0 as the overlap n - |lag| gets smaller"""
+
+    n_fft = _fft_size(n)
+    # products[..., k] = sum_t x[t] * y[t + k] (negative k at the end)
+    products = np.fft.irfft(np.conj(fx) * fy, n_fft)
+
+    return products[..., lags % n_fft] / n
+
+def _as_frame(ys):
+    if isinstance(ys, pd.Series):
+        return ys.to_frame()
+    if isinstance(ys, pd.DataFrame):
+        return ys
+
+    ys = np.atleast_2d(np.asarray(ys, dtype=np.float64))
+
+    return pd.DataFrame(ys.T)
+
+# correlations
+
+def cross_correlation(x, ys, max_lag=6):
+    """Function computing the correlations of x with each series of ys (the columns of a df, one group per column)
+    for the lags -max_lag to max_lag
+
+    x and ys have the same time index (or length), each series being standardized over its whole length and
+    the lagged sums divided by n (see _lagged_products). Returns the df of the correlations with the groups as
+    rows and the lags as columns"""
+
+    ys = _as_frame(ys)
+    n = len(ys)
+    lags = np.arange(-max_lag, max_lag + 1)
+    if max_lag >= n:
+        raise ValueError(f'max_lag must be smaller than the length of the series ({n})')
+
+    zx = _standardize(x)
+    zy = _standardize(ys.to_numpy(dtype=np.float64).T)
+    n_fft = _fft_size(n)
+
+    correlations = _lagged_products(np.fft.rfft(zx, n_fft), np.fft.rfft(zy, n_fft), n, lags)
+
+    return pd.DataFrame(correlations, index=ys.columns, columns=pd.Index(lags, name='lag'))
+
+def permutation_test(x, ys, max_lag=6, n_permutations=10000, method='shuffle', batch_size=500, seed=0):
+    """Function testing the lagged correlations of x with each series of ys against n_permutations permutations of x
+
+    method is 'shuffle' (random order of x) or 'roll' (random circular shifts of x, which keep its autocorrelation).
+    The permutations are correlated with all the groups and lags at once, batch_size permutations at a time.
+
+    Returns a df with one row per (group, lag): the correlation, its two-sided p-value and the p-value
+    corrected over the lags (against the maximum absolute correlation of each permutation over the lags),
+    NaN when the correlation is NaN (x or the series of the group without variance)"""
+
+    ys = _as_frame(ys)
+    n = len(ys)
+    lags = np.arange(-max_lag, max_lag + 1)
+    observed = cross_correlation(x, ys, max_lag)
+    absolute = np.abs(observed.to_numpy())
+
+    zx = _standardize(x)
+    n_fft = _fft_size(n)
+    fy = np.fft.rfft(_standardize(ys.to_numpy(dtype=np.float64).T), n_fft)
+
+    rng = np.random.default_rng(seed)
+    exceed = np.zeros(absolute.shape, dtype=np.int64)
+    exceed_max = np.zeros(absolute.shape, dtype=np.int64)
+    for start in range(0, n_permutations, batch_size):
+        size = min(batch_size, n_permutations - start)
+        if method == 'shuffle':
+            permuted = rng.permuted(np.broadcast_to(zx, (size, n)), axis=1)
+        elif method == 'roll':
+            shifts = rng.integers(1, n, size=size)
+            permuted = zx[(np.arange(n) - shifts[:, None]) % n]
+        else:
+            raise ValueError(f"method must be 'shuffle' or 'roll', not {method!r}")
+
+        # (permutations, groups, lags)
+        correlations = np.abs(_lagged_products(np.fft.rfft(permuted, n_fft)[:, None, :], fy[None], n, lags))
+        exceed += (correlations >= absolute - 1e-12).sum(axis=0)
+        exceed_max += (correlations.max(axis=2)[:, :, None] >= absolute - 1e-12).sum(axis=0)
+
+    index = pd.MultiIndex.from_product([observed.index, lags], names=['group', 'lag'])
+    # no test without a correlation
+    missing = np.isnan(absolute)
+
+    return pd.DataFrame({'correlation': observed.to_numpy().ravel(),
+                         'pvalue': np.where(missing, np.nan, (exceed + 1) / (n_permutations + 1)).ravel(),
+                         'pvalue_max': np.where(missing, np.nan, (exceed_max + 1) / (n_permutations + 1)).ravel()},
+                        index=index)
+
+def panel_correlations(panel, x='DAMAGE_PROPERTY', y='sentiment_mean', groups=None, freq='M', max_lag=6, **kwargs):
+    """Function testing the lagged correlations of the x column (damages) with the y column (sentiment_mean,
+    weighted_sentiment, quotes...) of each group of a TimePanel on the grid of freq (see permutation_test)"""
+
+    frame = panel.at(freq)
+    ys = frame[y].unstack('group')
+    if groups is not None:
+        ys = ys[list(groups)]
+    xs = frame[x].unstack('group').iloc[:, 0]
+
+    return permutation_test(xs, ys, max_lag, **kwargs)
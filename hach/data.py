@@ -1,61 +1,303 @@
 import os
+import bz2
+import json
+import shutil
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+from .matching import KeywordMatcher
+from .metrics import get_attributes
+from .labels import load_labels
+from .speaker_index import SpeakerIndex
 from .text_analysis import *
 
+# parquet store of the related quotes, partitioned by year and month
+climate_store = 'data/climate_quotes'
 
-def _extract_quotes_in_year(reg_query, year):
-    # init chunk reader
-    df_reader = pd.read_json(f'data/quotebank/quotes-{year}.json.bz2', lines=True, compression='bz2', chunksize = 100000)
+# columns of the quotebank quotes and their dtypes (as read by pd.read_json), the matched keywords being added
+quotebank_dtypes = {'quoteID': object, 'quotation': object, 'speaker': object, 'qids': object, 'date': 'datetime64[ns]',
+                    'numOccurrences': 'int64', 'probas': object, 'urls': object, 'phase': object, 'keywords': object}
+
+
+def _write_related_quotes(related_df, year):
+    """Function writing the related quotes of one year to the parquet store (replacing the previous ones)"""
+    
+    partition = os.path.join(climate_store, f'year={year}')
+    shutil.rmtree(partition, ignore_errors=True)
+    
+    # a year without related quotes has an empty partition (read as an empty df)
+    if related_df.empty:
+        os.makedirs(partition)
+        return
+    
+    related_df = related_df.assign(year=year, month=related_df.date.dt.month)
+    related_df.to_parquet(climate_store, partition_cols=['year', 'month'])
+
+
+def _empty_related_quotes(columns=None):
+    """Function giving the typed df of related quotes without any quote (with the asked columns only)"""
+    
+    dtypes = dict(quotebank_dtypes, year='int64', month='int64') if columns is not None else quotebank_dtypes
+    
+    return pd.DataFrame({column: pd.Series(dtype=dtypes[column]) for column in (columns or dtypes)})
+
+
+def _decode_related_lines(numbered_lines, matcher):
+    """Function decoding only the json lines which pass the keyword prefilter, into a typed df of related quotes"""
+    
+    rows = []
+    records = []
+    for row, line in numbered_lines:
+        if matcher.prefilter(line):
+            rows.append(row)
+            records.append(json.loads(line))
+    
+    if not records:
+        return _empty_related_quotes()
+    
+    # same index (line number) and dtypes as pd.read_json
+    df = pd.DataFrame.from_records(records, index=pd.Index(rows))
+    df['date'] = pd.to_datetime(df['date'])
     
-    # query each chunk
-    dfs = []
-    for chunk in df_reader:
-        df = chunk[chunk.quotation.str.contains(reg_query, case=False, na=False)]
-        dfs.append(df)
+    # the prefilter also matches the other fields, check on the decoded quotation
+    return matcher.filter(df)
+
+
+def _related_quotes_in_year(matcher, year):
+    """Function decompressing and filtering the quotebank file of one year, giving its related quotes
+    (runs in a worker process with n_jobs > 1, only the related quotes being sent back)"""
+    
+    with bz2.open(f'data/quotebank/quotes-{year}.json.bz2', 'rt', encoding='utf-8') as f:
+        return _decode_related_lines(enumerate(f), matcher)
+
+
+def extract_related_quotes(words, years, n_jobs=1):
+    """Function extracting the quotes containing one of the words for each year (the matched words in a 'keywords' column)
+    
+    With n_jobs > 1 (or None for all the cores) the years are extracted on a pool of up to n_jobs processes,
+    each year being decompressed and filtered by one worker (quotebank files are single bz2 streams, which
+    can't be split), giving the same data as the serial path"""
+    
+    # compile the words into a single matcher
+    matcher = KeywordMatcher(words)
+    years = list(years)
+    n_jobs = min(n_jobs or os.cpu_count(), len(years))
+    
+    if n_jobs <= 1:
+        # get related quotes for asked years
+        for year in years:
+            _write_related_quotes(_related_quotes_in_year(matcher, year), year)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = {year: pool.submit(_related_quotes_in_year, matcher, year) for year in years}
+            # the years are written in this process as they come back, in order
+            for year, result in results.items():
+                _write_related_quotes(result.result(), year)
+        
         
-    # combine dfs into one
-    related_df = pd.concat(dfs)
+def read_climate_quotes(year, columns=None, filters=None):
+    """Function reading the related quotes of one year from the parquet store
+    
+    Only the asked columns are read (e.g. ['speaker', 'qids', 'date'] never loads the quotations),
+    and filters (pyarrow format, e.g. [('month', '<=', 6)]) skip the non-matching partitions and row groups"""
+    
+    # year without related quotes (or not extracted)
+    partition = os.path.join(climate_store, f'year={year}')
+    if not any(names for _, _, names in os.walk(partition)):
+        return _empty_related_quotes(columns)
+    
+    filters = [('year', '=', year)] + (filters or [])
+    df = pd.read_parquet(climate_store, columns=columns, filters=filters)
+    
+    # the partition columns are only kept when asked for
+    if columns is None:
+        df = df.drop(columns=['year', 'month'])
     
-    # write to pickle
-    related_df.to_pickle(f'data/climate_df_{year}.pkl')
+    # back in the order of the quotebank file
+    return df.sort_index()
 
-def extract_related_quotes(words, years):
-    # make regex query from words
-    reg_query = "|".join(words)
-    # get related quotes for asked years
-    for year in years:
-        _extract_quotes_in_year(reg_query, year)
+
+class FrameCache:
+    """LRU cache of dfs bounded by their total memory usage (in bytes)"""
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()
+        self._sizes = {}
         
+    def get(self, key):
+        """Function returning the cached df for key (None if not cached)"""
         
-def get_climate_data(years=[2017,2018,2019,2020]):
-    dfs = {}
-    full_df = pd.DataFrame()
-    for year in years:
-        df = pd.read_pickle(f"data/climate_df_{year}.pkl")
-        dfs[year] = df
-        full_df = full_df.append(df)
+        if key not in self._frames:
+            return None
+        self._frames.move_to_end(key)
         
-    return full_df, dfs
+        return self._frames[key]
     
+    def put(self, key, df):
+        """Function caching df, evicting the least recently used dfs to stay within the budget"""
+        
+        size = df.memory_usage(deep=True).sum()
+        # too big to ever fit
+        if size > self.max_bytes:
+            return
+        
+        self._frames[key] = df
+        self._sizes[key] = size
+        while sum(self._sizes.values()) > self.max_bytes:
+            old_key, _ = self._frames.popitem(last=False)
+            del self._sizes[old_key]
+            
+    def clear(self):
+        """Function emptying the cache"""
+        
+        self._frames.clear()
+        self._sizes.clear()
+        
+
+# per year dfs shared by all the ClimateData of the session
+frame_cache = FrameCache(max_bytes=8 * 1024**3)
 
-def extract_wiki_speakers(full_climate_df):
+
+class ClimateData(MutableMapping):
+    """Dict-like access to the related quotes of each year, the years being read on demand
+    
+    The years read from the store are kept in frame_cache (the key includes the store modification
+    time, so a new extraction is read again) and returned as shallow copies, so adding columns to a
+    year doesn't change the cached df. Assigning a year replaces it for this object only. The df of
+    all the years (full) is only built when asked for, and cached too"""
+    
+    def __init__(self, years=[2017,2018,2019,2020], columns=None, filters=None, cache=frame_cache):
+        self.years = list(years)
+        self.columns = columns
+        self.filters = filters
+        self.cache = cache
+        self._assigned = {}
+        # speaker index of each year with the cache key of the df it was built for
+        self._indexes = {}
+        # full df with the keys of its years, when some years are assigned (else in the cache)
+        self._full = None
+        
+    def _cache_key(self, year):
+        partition = os.path.join(climate_store, f'year={year}')
+        mtime = os.path.getmtime(partition) if os.path.exists(partition) else None
+        columns = None if self.columns is None else tuple(self.columns)
+        
+        return (year, columns, repr(self.filters), mtime)
+        
+    def __getitem__(self, year):
+        if year in self._assigned:
+            return self._assigned[year]
+        if year not in self.years:
+            raise KeyError(year)
+        
+        key = self._cache_key(year)
+        df = self.cache.get(key)
+        if df is None:
+            df = read_climate_quotes(year, self.columns, self.filters)
+            self.cache.put(key, df)
+            
+        return df.copy(deep=False)
+    
+    def speaker_index(self, year):
+        """Function giving the SpeakerIndex of the quotes of the year (to pass to get_quotes, select_speaker...),
+        built once per read or assignment of the year
+        
+        The index gives positions in the dfs returned for the year, it is not valid anymore for a df whose rows
+        or speakers were changed afterwards"""
+        
+        # the read years are identified by their cache key (a new extraction gives a new index), the index
+        # of an assigned year being dropped when it is assigned
+        key = None if year in self._assigned else self._cache_key(year)
+        entry = self._indexes.get(year)
+        if entry is None or entry[0] != key:
+            entry = self._indexes[year] = (key, SpeakerIndex(self[year]))
+        
+        return entry[1]
+    
+    def __setitem__(self, year, df):
+        if year not in self.years:
+            self.years.append(year)
+        self._assigned[year] = df
+        self._indexes.pop(year, None)
+        self._full = None
+        
+    def __delitem__(self, year):
+        self.years.remove(year)
+        self._assigned.pop(year, None)
+        self._indexes.pop(year, None)
+        self._full = None
+        
+    def __contains__(self, year):
+        # without reading the year
+        return year in self.years
+        
+    def __iter__(self):
+        return iter(self.years)
+    
+    def __len__(self):
+        return len(self.years)
     
-    # load wiki data (huge)
-    wiki_data = pd.read_parquet('parquet-data/speaker_attributes.parquet')
+    @property
+    def full(self):
+        """The quotes of all the years in one df (built with a single concat the first time, as a shallow copy then)"""
+        
+        # the read years are identified by their cache key, the assigned ones by their df
+        keys = tuple(('assigned', year, id(self._assigned[year])) if year in self._assigned else self._cache_key(year)
+                     for year in self.years)
+        
+        if self._assigned:
+            # only kept by this object
+            if self._full is None or self._full[0] != keys:
+                self._full = (keys, pd.concat([self[year] for year in self.years]))
+            return self._full[1].copy(deep=False)
+        
+        key = ('full', keys)
+        df = self.cache.get(key)
+        if df is None:
+            df = pd.concat([self[year] for year in self.years])
+            self.cache.put(key, df)
+        
+        return df.copy(deep=False)
     
-    # load the labels for wiki data
-    wiki_labels = pd.read_csv('data/wikidata_labels_descriptions_quotebank.csv.bz2', compression='bz2', index_col='QID')
+
+def get_climate_data(years=[2017,2018,2019,2020], columns=None, filters=None, full=True):
+    """Function loading the related quotes of the years, in one df and in a dict-like of dfs per year (see ClimateData)
+    
+    The years and the full df are cached for the next calls. With full=False only the dict-like is returned,
+    the years being read when accessed"""
+    
+    dfs = ClimateData(years, columns, filters)
+    if not full:
+        return dfs
+        
+    return dfs.full, dfs
+    
+
+def extract_wiki_speakers(full_climate_df, columns=None):
+    """Function extracting the wiki data of the speakers of the climate quotes
+    
+    Only the rows of these speakers (and the asked columns, all by default) are read from the parquet
+    file, so the returned wiki_data is restricted to them"""
     
     # get speaker ids of the whole climate change quotes dataset
-    wiki_speakers = pd.DataFrame(columns=wiki_data.columns)
-    speakers_ids = full_climate_df.qids.apply(lambda x: x[0]).unique().tolist()
+    speakers_ids = pd.Index(full_climate_df.qids.str[0].dropna().unique())
+    
+    # load wiki data of the speakers only (the full table is huge)
+    if columns is not None and 'id' not in columns:
+        columns = ['id'] + list(columns)
+    wiki_data = pd.read_parquet('parquet-data/speaker_attributes.parquet', columns=columns,
+                                filters=[('id', 'in', speakers_ids.tolist())])
+    
+    # load the labels for wiki data (compiled from the bz2 csv on the first run)
+    wiki_labels = load_labels()
+    
     wiki_data = wiki_data.set_index(wiki_data.id)
     
-    for i in speakers_ids:
-        if i in wiki_data.index:
-            wiki_speakers = wiki_speakers.append(wiki_data.loc[i])
-            
-    wiki_speakers = wiki_speakers.drop_duplicates('id')
+    # one row per id (first one kept), in the order of the speakers
+    wiki_speakers = wiki_data[~wiki_data.index.duplicated()]
+    wiki_speakers = wiki_speakers.reindex(speakers_ids[speakers_ids.isin(wiki_speakers.index)])
     
     # write the wiki data to pickle
     wiki_speakers.to_pickle('data/wiki_speakers.pkl')
@@ -63,8 +305,13 @@ def extract_wiki_speakers(full_climate_df):
     return wiki_data, wiki_labels, wiki_speakers
     
     
-def exctract_speakers(climate_dfs, wiki_speakers, wiki_labels):
+def extract_speakers(climate_dfs, wiki_speakers, wiki_labels):
+    """Function writing the attributes of the speakers of each year to pickles"""
     
     for i in range(2017, 2021):
         speakers_df = get_attributes(climate_dfs[i], wiki_speakers, wiki_labels)
         speakers_df.to_pickle('data/speakers_{}.pkl'.format(i))
+
+
+# previous name of extract_speakers
+exctract_speakers = extract_speakers
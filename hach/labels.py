@@ -0,0 +1,95 @@
+""" Compiled index of the Wikidata labels, giving the labels of many QIDs with array indexing """
+
+# imports
+
+import os
+import numpy as np
+import pandas as pd
+
+# global variables
+
+labels_csv = 'data/wikidata_labels_descriptions_quotebank.csv.bz2'
+labels_path = 'data/wiki_labels.parquet'
+
+# helpers
+
+def qid_codes(qids):
+    """Function encoding QIDs ('Q42') as integers (42), -1 for the missing or malformed ones"""
+
+    qids = pd.Series(qids, dtype=object)
+    codes = pd.to_numeric(qids.where(qids.str[:1] == 'Q').str[1:], errors='coerce')
+
+    return codes.fillna(-1).to_numpy(dtype=np.int64)
+
+# label index
+
+class LabelIndex:
+    """QID to label table: the sorted integer codes of the QIDs and their labels as a categorical
+
+    Built once from the bz2 csv with compile_labels and loaded from a parquet file with load_labels"""
+
+    def __init__(self, codes, labels):
+        self.codes = codes
+        self.labels = labels
+
+    @classmethod
+    def from_frame(cls, wiki_labels):
+        """Function building the index from the labels df (QID index, Label column), first label kept for each QID"""
+
+        codes = qid_codes(wiki_labels.index)
+        table = pd.DataFrame({'qid': codes, 'label': wiki_labels['Label'].to_numpy()})
+        table = table[table.qid >= 0].drop_duplicates('qid').sort_values('qid')
+
+        return cls(table.qid.to_numpy(), pd.Categorical(table.label))
+
+    def lookup(self, qids):
+        """Function giving the labels of the QIDs (None for the missing ones), as an object Series"""
+
+        index = qids.index if isinstance(qids, pd.Series) else None
+        codes = qid_codes(qids)
+
+        if len(self.codes) == 0:
+            return pd.Series([None] * len(codes), index=index, dtype=object)
+
+        # position of each QID in the sorted codes, -1 label code when it is not there
+        positions = np.searchsorted(self.codes, codes).clip(max=len(self.codes) - 1)
+        found = (codes >= 0) & (self.codes[positions] == codes)
+        labels = pd.Categorical.from_codes(np.where(found, self.labels.codes[positions], -1),
+                                           categories=self.labels.categories)
+
+        return pd.Series(labels, index=index).astype(object).where(found, None)
+
+    def to_frame(self):
+        """Function giving the labels df (QID index, Label column)"""
+
+        return pd.DataFrame({'Label': self.labels}, index=pd.Index(np.char.add('Q', self.codes.astype(str)), name='QID'))
+
+    def save(self, path=labels_path):
+        """Function writing the index to a parquet file (the labels being dictionary encoded)"""
+
+        pd.DataFrame({'qid': self.codes, 'label': self.labels}).to_parquet(path, index=False)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __repr__(self):
+        return f'LabelIndex({len(self)} QIDs, {len(self.labels.categories)} labels)'
+
+def compile_labels(csv_path=labels_csv, path=labels_path):
+    """Function building the label index from the bz2 csv of the labels and writing it to path"""
+
+    wiki_labels = pd.read_csv(csv_path, compression='bz2', index_col='QID', usecols=['QID', 'Label'])
+    index = LabelIndex.from_frame(wiki_labels)
+    index.save(path)
+
+    return index
+
+def load_labels(path=labels_path, csv_path=labels_csv):
+    """Function loading the label index, compiling it from the csv the first time"""
+
+    if not os.path.exists(path):
+        return compile_labels(csv_path, path)
+
+    table = pd.read_parquet(path)
+
+    return LabelIndex(table.qid.to_numpy(dtype=np.int64), pd.Categorical(table.label))
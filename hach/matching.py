@@ -0,0 +1,72 @@
+""" Keyword matching module for the extraction of related quotes """
+
+# imports
+
+import re
+import json
+
+# helpers
+
+def _trie_regex(words):
+    """Function compiling a list of words into a trie shaped regex (each prefix is only matched once)"""
+    
+    # build the trie of the words, '' marking the end of a word
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+        
+    def _to_regex(node):
+        branches = [re.escape(char) + _to_regex(child) for char, child in sorted(node.items()) if char != '']
+        if not branches:
+            return ''
+        # a word ending here makes the rest of the branch optional
+        if '' in node:
+            return '(?:' + '|'.join(branches) + ')?'
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+    
+    return _to_regex(trie)
+
+
+class KeywordMatcher:
+    """Case-insensitive matcher of a list of keywords in quotes
+    
+    The quotes are lowercased once and scanned with a single trie regex (no backtracking over
+    every alternative), the matched keywords being only looked up for the quotes that passed.
+    The keywords are matched as plain text, not as regex."""
+    
+    def __init__(self, words):
+        # lowercase and deduplicate while keeping the order of the words
+        self.words = list(dict.fromkeys(word.lower() for word in words if word))
+        self.pattern = re.compile(_trie_regex(self.words))
+        # keywords with characters escaped in json (non-ascii, quotes, ...) can't be seen in the raw lines
+        self.escaped_lines = any(json.dumps(word)[1:-1] != word for word in self.words)
+        
+    def contains(self, quotes):
+        """Function giving the boolean mask of the quotes containing at least one keyword"""
+        
+        return quotes.str.lower().str.contains(self.pattern, na=False)
+    
+    def prefilter(self, line):
+        """Function telling if a raw json line may contain a keyword (no false negatives, checked again after decoding)"""
+        
+        line = line.lower()
+        
+        return self.pattern.search(line) is not None or (self.escaped_lines and '\\' in line)
+    
+    def matches(self, quotes):
+        """Function giving the list of keywords contained in each quote"""
+        
+        return quotes.str.lower().apply(lambda quote: [word for word in self.words if word in quote] 
+                                        if isinstance(quote, str) else [])
+    
+    def filter(self, df, column='quotation'):
+        """Function keeping the rows of df related to the keywords, with the matched keywords in a new column"""
+        
+        related = df[self.contains(df[column])]
+        
+        return related.assign(keywords=self.matches(related[column]))
@@ -2,6 +2,7 @@
 import numpy as np
 import pandas as pd
 from datetime import datetime
+from .labels import LabelIndex
 
 #################
 # Top_ funnctions
@@ -10,7 +11,7 @@ from datetime import datetime
 def top_speakers(df, n):
     """Function to extract the top n speakers"""
     
-    top_speakers = df.groupby('speaker')['quotation'].count().sort_values(ascending=False).to_frame().add_suffix('_count')
+    top_speakers = df.groupby('speaker', observed=True)['quotation'].count().sort_values(ascending=False).to_frame().add_suffix('_count')
     top_speakers.reset_index(drop=False, inplace=True)
     
     return top_speakers.head(n)
@@ -26,10 +27,13 @@ def top_quotations(df, n):
     return top_quotations.head(n)
 
 
-def get_quotes(speaker, df):
-    """Function to get all the quotes for a speaker and classify them by its nb of occurrences"""
+def get_quotes(speaker, df, index=None):
+    """Function to get all the quotes for a speaker and classify them by its nb of occurrences
     
-    quotes = df[df['speaker'] == speaker][['quotation', 'numOccurrences']]
+    With the SpeakerIndex of df (e.g. ClimateData.speaker_index) the rows are looked up instead of scanned"""
+    
+    quotes = df.iloc[index.rows(speaker)] if index is not None else df[df['speaker'] == speaker]
+    quotes = quotes[['quotation', 'numOccurrences']]
     
     return quotes.sort_values(by='numOccurrences', ascending=False).reset_index(drop=True)
 
@@ -37,13 +41,22 @@ def get_quotes(speaker, df):
 # Extracting attribute functions
 ################################
 
-def get_qids(name, df): 
-    """Function giving the list of qids for a speaker from df"""
+def get_qids(name, df, index=None): 
+    """Function giving the list of qids for a speaker from df (of the first quote of the speaker, looked up in
+    the SpeakerIndex of df if given)"""
     
-    ids = df[df.speaker == name].iloc[0].qids
+    ids = df.qids.iloc[index.first_row(name)] if index is not None else df[df.speaker == name].iloc[0].qids
     
     return ids
 
+def _label(qid, wiki_labels):
+    """Helper function giving the label of a qid from the labels (a LabelIndex, None when missing, or the labels df)"""
+    
+    if isinstance(wiki_labels, LabelIndex):
+        return wiki_labels.lookup([qid]).iloc[0]
+    
+    return wiki_labels.loc[qid]['Label']
+
 def get_gender(name, df, wiki_speakers, wiki_labels):
     """Function extracting the gender for a speaker"""
     
@@ -60,7 +73,7 @@ def get_gender(name, df, wiki_speakers, wiki_labels):
                 gender = None
             else:
                 qid = gender_qids[0]
-                gender = wiki_labels.loc[qid]['Label']
+                gender = _label(qid, wiki_labels)
     
     return gender
 
@@ -103,7 +116,7 @@ def get_nationality(name, df, wiki_speakers, wiki_labels):
                 nationality = None
             else:
                 qid = wiki_speakers.loc[ids[0]]['nationality'][0]
-                nationality = wiki_labels.loc[qid]['Label']
+                nationality = _label(qid, wiki_labels)
     
     return nationality
 
@@ -124,7 +137,7 @@ def get_party(name, df, wiki_speakers, wiki_labels):
                 party = None
             else:
                 # @TODO are the parties given always in the same chronological order ??
-                party = wiki_labels.loc[party_id[0]].Label
+                party = _label(party_id[0], wiki_labels)
         
     return party
 
@@ -144,41 +157,124 @@ def get_occupation(name, df, wiki_speakers, wiki_labels):
             if occupation_id is None:
                 occupation = None
             else:
-                occupation = wiki_labels.loc[occupation_id[0]].Label
+                occupation = _label(occupation_id[0], wiki_labels)
         
     return occupation
     
 
+def _first_label(qids, labels):
+    """Helper function giving the label of the first qid of each list (None when missing) from the LabelIndex"""
+    
+    return labels.lookup(qids.str[0])
+
+
 def get_attributes(df, wiki_attributes, labels):
-    """THE FUNCTION exctracting all the relevant attributes of the speakers"""
+    """THE FUNCTION exctracting all the relevant attributes of the speakers
+    
+    Same result as the get_gender/get_age/... helpers applied to each speaker, in one lookup of the
+    first qid of each speaker in wiki_attributes and one lookup of the attribute qids in the labels
+    (a LabelIndex, see labels.load_labels, or the labels df)"""
     
     # unique speakers and their quotation count
     speakers = top_speakers(df, len(df.speaker.unique()))
     
+    # wiki attributes of the first qid of the first quote of each speaker
+    first_qids = df.drop_duplicates('speaker').set_index('speaker').qids.str[0]
+    wiki_attributes = wiki_attributes[~wiki_attributes.index.duplicated()]
+    attributes = wiki_attributes.reindex(speakers.speaker.map(first_qids).values)
+    attributes.index = speakers.index
+    
+    if not isinstance(labels, LabelIndex):
+        labels = LabelIndex.from_frame(labels)
+    
     # extracting gender
-    speakers['gender'] = speakers['speaker'].apply(lambda s: get_gender(s, df, wiki_attributes, labels))
-    # extracting age 
-    speakers['age'] = speakers['speaker'].apply(lambda s: get_age(s, df, wiki_attributes))
+    speakers['gender'] = _first_label(attributes.gender, labels)
+    # extracting age (from the year of the first birth date, Int16 in compact_speakers)
+    speakers['age'] = int(datetime.now().strftime('%Y')) - attributes.date_of_birth.str[0].str[1:5].astype(float)
     # extracting nationality
-    speakers['nationality'] = speakers['speaker'].apply(lambda s: get_nationality(s, df, wiki_attributes, labels))
+    speakers['nationality'] = _first_label(attributes.nationality, labels)
     # extracting political party 
-    speakers['political_party'] = speakers['speaker'].apply(lambda s: get_party(s, df, wiki_attributes, labels))
+    speakers['political_party'] = _first_label(attributes.party, labels)
     # extarcting occupation
-    speakers['occupation'] = speakers['speaker'].apply(lambda s: get_occupation(s, df, wiki_attributes, labels))
+    speakers['occupation'] = _first_label(attributes.occupation, labels)
     
-    return speakers
+    return compact_speakers(speakers)
 
 
 def get_speakers_by_year(speakers):
     """Function putting all the speakers for all the years in one df"""
 
-    for year in range (2017, 2021):
-        s = speakers[year].copy()
-        if year == 2017:
-            all_speakers = s
-            all_speakers['year'] = year
-        else:
-            s['year'] = year
-            all_speakers = all_speakers.append(s)
-            
-    return all_speakers
\ No newline at end of file
+    all_speakers = pd.concat([speakers[year].assign(year=np.int16(year)) for year in range(2017, 2021)])
+    
+    # the categories differ between the years, so the concatenated attributes are categorical again
+    return compact_speakers(all_speakers)
+
+
+################
+# Compact dtypes
+################
+
+attribute_columns = ['gender', 'nationality', 'political_party', 'occupation']
+
+def compact_speakers(speakers):
+    """Function giving the speakers df with categorical attributes, Int16 age and int32 quotation count"""
+    
+    compact = {column: speakers[column].astype('category') for column in attribute_columns if column in speakers}
+    if 'age' in speakers:
+        compact['age'] = speakers.age.round().astype('Int16')
+    if 'quotation_count' in speakers:
+        compact['quotation_count'] = speakers.quotation_count.astype(np.int32)
+    
+    return speakers.assign(**compact)
+
+
+def merge_speakers(df, speakers):
+    """Function merging the quotes with the attributes of their speakers (as the dfs_speakers of the notebooks)
+    
+    The speakers are categorical and the scores float32 in the merged df"""
+    
+    merged = df.merge(compact_speakers(speakers), left_on='speaker', right_on='speaker')
+    
+    compact = {column: merged[column].astype(np.float32) for column in ['sentiment_score', 'complexity'] if column in merged}
+    compact['speaker'] = merged.speaker.astype('category')
+    
+    return merged.assign(**compact)
+
+
+def select(df, column, values):
+    """Function selecting the rows of df whose column is one of the values (or equal to the value)
+    
+    e.g. select(df, 'political_party', 'Republican Party'), select(df, 'nationality', countries_europe)"""
+    
+    if isinstance(values, str) or not np.iterable(values):
+        values = [values]
+    
+    return df[df[column].isin(values)]
+
+
+def _speaker_mask(speakers, name, how):
+    """Function giving the mask of the speakers matching name as SpeakerIndex.lookup"""
+    
+    if how == 'exact':
+        return speakers == name
+    
+    lower, name = speakers.str.lower(), name.lower()
+    if how == 'ignore_case':
+        return lower == name
+    if how == 'prefix':
+        return lower.str.startswith(name, na=False)
+    if how == 'contains':
+        return lower.str.contains(name, regex=False, na=False)
+    
+    raise ValueError(f"how must be 'exact', 'ignore_case', 'prefix' or 'contains', not {how!r}")
+
+def select_speaker(df, name, how='contains', index=None):
+    """Function selecting the quotes of the speakers whose name contains name (case insensitive)
+    
+    how is 'contains', 'exact', 'ignore_case' or 'prefix' (see speaker_index.SpeakerIndex.lookup). The names
+    are searched in the SpeakerIndex of df if given (e.g. ClimateData.speaker_index), else df is scanned"""
+    
+    if index is not None:
+        return df.iloc[index.lookup(name, how)]
+    
+    return df[_speaker_mask(df.speaker, name, how)]
\ No newline at end of file
@@ -7,6 +7,7 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from .storm_events import parse_damage
 
 # global variables
 
@@ -17,13 +18,8 @@ month_names = ['Jan','Feb','Mar','Apr','May','Jun', 'Jul','Aug','Sep','Oct','Nov
 # helpers
 
 def as_number(nb):
-    """ Function to convert abbreviations to numbers"""
-    if 'K' in nb:
-        return float(nb.replace('K', '')) * 1000
-    elif 'M' in nb:
-        return float(nb.replace('M', '')) * 1000 * 1000
-    elif 'B' in nb:
-        return float(nb.replace('B', '')) * 1000 * 1000 * 1000
+    """ Function to convert abbreviations to numbers (see storm_events.parse_damages for whole columns)"""
+    return parse_damage(nb)
     
 def M_K(x):
     """ Function to convert numbers into abbreviations"""
@@ -39,40 +35,88 @@ def M_K(x):
         return x
     return str(x) + 'K'
 
+# event summary
+
+summary_columns = ['EVENTS', 'DAMAGE_PROPERTY', 'DAMAGE_CROPS']
+
+def event_summary(events):
+    """ Function to count the events and sum their damages per (YEAR, MONTH, EVENT_TYPE) in one groupby
+
+    events are the storm events of storm_events.load_storm_events (or the old df_det_skinned, with the month numbers in MONTH_NAME) """
+    month = 'MONTH' if 'MONTH' in events else 'MONTH_NAME'
+    damages = [column for column in summary_columns[1:] if column in events]
+
+    grouped = events.groupby(['YEAR', month, 'EVENT_TYPE'], observed=True)
+    summary = grouped[damages].sum()
+    summary.insert(0, 'EVENTS', grouped.size())
+    summary.index = summary.index.set_names(['YEAR', 'MONTH', 'EVENT_TYPE'])
+
+    return summary.sort_index()
+
+def _summary(data):
+    """ Helper giving the event summary of data (events or an event summary) """
+    if 'EVENTS' in data and data.index.names == ['YEAR', 'MONTH', 'EVENT_TYPE']:
+        return data
+    return event_summary(data)
+
+def events_per_year(data):
+    """ Function giving the nb of events of each year of years """
+    return _summary(data).EVENTS.groupby(level='YEAR').sum().reindex(years, fill_value=0)
+
+def event_type_counts(data, year):
+    """ Function giving the nb of events per type of the year, most frequent first """
+    counts = _summary(data).EVENTS.xs(year, level='YEAR').groupby(level='EVENT_TYPE', observed=True).sum()
+    return counts[counts > 0].sort_values(ascending=False, kind='stable')
+
+def monthly_damages(data, column='DAMAGE_PROPERTY'):
+    """ Function giving the total damages per (YEAR, MONTH) (the df_damages of the notebook) """
+    return _summary(data)[column].groupby(level=['YEAR', 'MONTH']).sum()
+
+def natural_damages(data, column='DAMAGE_PROPERTY'):
+    """ Function giving the total damages per month (rows 1 to 12) and year (columns) """
+    return monthly_damages(data, column).unstack(level=0).reindex(range(1, 13))
+
+def damages_sum(data, column='DAMAGE_PROPERTY'):
+    """ Function giving the total damages of each month with the date of the first day of the month, the months
+    without events included (the damages_sum of the notebook) """
+    damages = monthly_damages(data, column)
+    dates = pd.to_datetime(pd.DataFrame({'year': damages.index.get_level_values('YEAR'),
+                                         'month': damages.index.get_level_values('MONTH'), 'day': 1}))
+    damages = pd.Series(damages.values, index=dates)
+    damages = damages.reindex(pd.date_range(damages.index.min(), damages.index.max(), freq='MS'), fill_value=0)
+
+    return damages.rename(column).rename_axis('date').reset_index()
+
 # plots
 
 def plot_nb_events(df_det_skinned):
-    """ Function to plot the nb of events per year """
-    nb_events = []
-
-    for year in years:
-        nb_events.append(len(df_det_skinned[df_det_skinned['YEAR'] == year]))
+    """ Function to plot the nb of events per year (from the events or their event_summary) """
+    nb_events = events_per_year(df_det_skinned)
 
     plt.bar(years, nb_events)
     plt.xlabel('Year')
     plt.ylabel('Number of extreme weather events')
     
 def plot_event_types_frequency(df_det_skinned):
-    """ Function to plot the nb of events per type for each year """
+    """ Function to plot the nb of events per type for each year (from the events or their event_summary) """
+    summary = _summary(df_det_skinned)
     for year in years:
-        df_year = df_det_skinned[df_det_skinned['YEAR'] == year]
-        df_events = df_year[['EVENT_TYPE']]
-        df_events_count = df_events.apply(pd.value_counts)
+        df_events_count = event_type_counts(summary, year).to_frame('EVENT_TYPE')
         df_events_count.plot(kind='bar', figsize=(15,5))
         plt.title('Year %i' %year)
         
 def plot_top_10_event_types(df_det_skinned):
-    """ Function to plot the top 10 event types for each year """
+    """ Function to plot the top 10 event types for each year (from the events or their event_summary) """
+    summary = _summary(df_det_skinned)
     for year in years:
-        df_year = df_det_skinned[df_det_skinned['YEAR'] == year]
-        df_events = df_year[['EVENT_TYPE']]
-        df_events_count = df_events.apply(pd.value_counts)
-        df_events_count.sort_values(by='EVENT_TYPE') # Sort for later selection
+        df_events_count = event_type_counts(summary, year).to_frame('EVENT_TYPE')
         df_events_count[:10].plot(kind='bar', figsize=(10,5)) # Keep only the top 10
         plt.title('Year %i' %year)
         
 def plot_damages(df_damages):
-    """ Function to plot the total damages per month """
+    """ Function to plot the total damages per month (df_damages being monthly_damages, the events or their event_summary) """
+    if isinstance(df_damages, pd.DataFrame):
+        df_damages = monthly_damages(df_damages)
     damage = df_damages.unstack(level=0).plot(kind='bar', 
                                          subplots=True, 
                                          rot=0, 
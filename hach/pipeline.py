@@ -0,0 +1,239 @@
+""" Incremental pipeline running the extraction and text analysis stages without the notebooks
+
+Each stage declares, per year (or for all the years), the files it reads, the parameters it depends on and
+the files it writes. A task is re-run only when one of its outputs is missing or when the fingerprint of its
+inputs (size and modification time of the files) and parameters changed since its last run. Usage:
+
+    python -m hach.pipeline --years 2017 2018 2019 2020 --jobs 8
+    python -m hach.pipeline --stages sentiment complexity --dry-run
+"""
+
+# imports
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import pandas as pd
+import flair
+import textstat
+from .data import extract_related_quotes, get_climate_data, extract_wiki_speakers, climate_store
+from .cleaning import clean_df, speaker_names
+from .metrics import get_attributes
+from .labels import compile_labels, load_labels, labels_csv, labels_path
+from .text_analysis import load_classifier, score_sentiment, score_complexity, sentiment_cache, complexity_cache
+
+# global variables
+
+related_words = ["climate", "global warming", "greenhouse gas", "gas emissions", "greenhouse effect", "pollution", "carbon emissions"]
+
+state_path = 'data/.pipeline_state.json'
+
+speaker_names_path = 'data/speaker_names.pkl'
+
+# fingerprints
+
+def _path_fingerprint(path):
+    """Function giving the (relative path, size, modification time) of the file or of the files of the directory"""
+
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    elif os.path.exists(path):
+        files = [path]
+    else:
+        return [path, None]
+
+    return [[file, os.path.getsize(file), os.stat(file).st_mtime_ns] for file in files]
+
+def fingerprint(inputs, params):
+    """Function hashing the state of the input files and the parameters of a task"""
+
+    content = json.dumps({'inputs': [_path_fingerprint(path) for path in inputs], 'params': params}, sort_keys=True, default=str)
+
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def _load_state():
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path) as f:
+        return json.load(f)
+
+def _save_state(state):
+    with open(state_path, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+# stages
+
+class Stage:
+    """A step of the pipeline, run per year or for all the years at once (per_year=False)
+
+    inputs, outputs and params are functions of (year, config), year being None for the stages over all the
+    years, and run(years, config) computes the outputs of the stale years"""
+
+    def __init__(self, name, inputs, outputs, params, run, per_year=True):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params
+        self.run = run
+        self.per_year = per_year
+
+    def tasks(self, years):
+        """Function giving the partitions of the stage: each year, or None for all the years"""
+
+        return list(years) if self.per_year else [None]
+
+    def key(self, year):
+        return self.name if year is None else f'{self.name}/{year}'
+
+def _quotebank_path(year):
+    return f'data/quotebank/quotes-{year}.json.bz2'
+
+def _climate_path(year):
+    return os.path.join(climate_store, f'year={year}')
+
+def _sentiments_path(year):
+    return f'data/climate_df_sentiments_{year}.pkl'
+
+def _complexity_path(year):
+    return f'data/climate_df_complexity{year}.pkl'
+
+def _run_extract(years, config):
+    extract_related_quotes(config['words'], years, n_jobs=config['jobs'])
+
+def _run_labels(years, config):
+    compile_labels()
+
+def _run_wiki_speakers(years, config):
+    full_df, _ = get_climate_data(config['years'], columns=['qids'])
+    extract_wiki_speakers(full_df)
+
+def _run_speaker_names(years, config):
+    dfs = get_climate_data(config['years'], columns=['speaker', 'qids'], full=False)
+    speaker_names([dfs[year] for year in config['years']]).to_pickle(speaker_names_path)
+
+def _run_sentiment(years, config):
+    dfs = get_climate_data(years, full=False)
+    names = pd.read_pickle(speaker_names_path)
+    if config['jobs'] == 1:
+        classifier = load_classifier()
+    else:
+        classifier = None
+    with sentiment_cache() as cache:
+        for year in years:
+            df = clean_df(dfs[year], names)
+            score_sentiment(df, classifier, n_jobs=config['jobs'], cache=cache)
+            df.to_pickle(_sentiments_path(year))
+
+def _run_complexity(years, config):
+    dfs = {year: pd.read_pickle(_sentiments_path(year)) for year in years}
+    with complexity_cache() as cache:
+        score_complexity(dfs, n_jobs=config['jobs'], cache=cache)
+    for year in years:
+        dfs[year].to_pickle(_complexity_path(year))
+
+def _run_speakers(years, config):
+    dfs = get_climate_data(years, columns=['speaker', 'qids', 'quotation'], full=False)
+    wiki_speakers = pd.read_pickle('data/wiki_speakers.pkl')
+    wiki_labels = load_labels()
+    for year in years:
+        get_attributes(dfs[year], wiki_speakers, wiki_labels).to_pickle(f'data/speakers_{year}.pkl')
+
+stages = [
+    Stage('extract',
+          inputs=lambda year, config: [_quotebank_path(year)],
+          outputs=lambda year, config: [_climate_path(year)],
+          params=lambda year, config: {'words': sorted(config['words'])},
+          run=_run_extract),
+    Stage('labels',
+          inputs=lambda year, config: [labels_csv],
+          outputs=lambda year, config: [labels_path],
+          params=lambda year, config: {},
+          run=_run_labels, per_year=False),
+    Stage('wiki_speakers',
+          inputs=lambda year, config: [_climate_path(y) for y in config['years']] + ['parquet-data/speaker_attributes.parquet'],
+          outputs=lambda year, config: ['data/wiki_speakers.pkl'],
+          params=lambda year, config: {'years': config['years']},
+          run=_run_wiki_speakers, per_year=False),
+    Stage('speaker_names',
+          inputs=lambda year, config: [_climate_path(y) for y in config['years']],
+          outputs=lambda year, config: [speaker_names_path],
+          params=lambda year, config: {'years': config['years']},
+          run=_run_speaker_names, per_year=False),
+    Stage('sentiment',
+          inputs=lambda year, config: [_climate_path(year), speaker_names_path],
+          outputs=lambda year, config: [_sentiments_path(year)],
+          params=lambda year, config: {'model': 'en-sentiment', 'flair': flair.__version__},
+          run=_run_sentiment),
+    Stage('complexity',
+          inputs=lambda year, config: [_sentiments_path(year)],
+          outputs=lambda year, config: [_complexity_path(year)],
+          params=lambda year, config: {'textstat': getattr(textstat, '__version__', '')},
+          run=_run_complexity),
+    Stage('speakers',
+          inputs=lambda year, config: [_climate_path(year), 'data/wiki_speakers.pkl', labels_path],
+          outputs=lambda year, config: [f'data/speakers_{year}.pkl'],
+          params=lambda year, config: {},
+          run=_run_speakers),
+]
+
+# runner
+
+def _is_stale(stage, year, config, state, changed):
+    if any(not os.path.exists(path) for path in stage.outputs(year, config)):
+        return True
+    # inputs rewritten by a previous stage of this run (seen before running it with dry_run)
+    if any(path in changed for path in stage.inputs(year, config)):
+        return True
+
+    return state.get(stage.key(year)) != fingerprint(stage.inputs(year, config), stage.params(year, config))
+
+def run_pipeline(years=[2017, 2018, 2019, 2020], only=None, words=related_words, jobs=1, force=False, dry_run=False):
+    """Function running the stale tasks of the stages (all, or the ones named in only) in order
+
+    Returns the list of the tasks run (or to run with dry_run)"""
+
+    config = {'years': list(years), 'words': list(words), 'jobs': jobs}
+    state = _load_state()
+
+    done = []
+    changed = set()
+    for stage in stages:
+        if only is not None and stage.name not in only:
+            continue
+
+        stale = [year for year in stage.tasks(years) if force or _is_stale(stage, year, config, state, changed)]
+        if not stale:
+            print(f'{stage.name}: up to date')
+            continue
+
+        print(f'{stage.name}: running {", ".join(stage.key(year) for year in stale)}')
+        done.extend(stage.key(year) for year in stale)
+        changed.update(path for year in stale for path in stage.outputs(year, config))
+        if dry_run:
+            continue
+
+        stage.run(list(years) if stale == [None] else stale, config)
+
+        # the fingerprints are taken after the run, so that the next stages see the new outputs
+        for year in stale:
+            state[stage.key(year)] = fingerprint(stage.inputs(year, config), stage.params(year, config))
+        _save_state(state)
+
+    return done
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m hach.pipeline', description='Run the stale stages of the climate quotes pipeline')
+    parser.add_argument('--years', type=int, nargs='+', default=[2017, 2018, 2019, 2020])
+    parser.add_argument('--stages', nargs='+', choices=[stage.name for stage in stages], help='stages to consider (all by default)')
+    parser.add_argument('--words', nargs='+', default=related_words, help='climate related words of the extraction')
+    parser.add_argument('--jobs', type=int, default=1, help='number of processes (0 for all the cores)')
+    parser.add_argument('--force', action='store_true', help='run the tasks even if they are up to date')
+    parser.add_argument('--dry-run', action='store_true', help='only list the stale tasks')
+    args = parser.parse_args(argv)
+
+    run_pipeline(args.years, args.stages, args.words, args.jobs or None, args.force, args.dry_run)
+
+if __name__ == '__main__':
+    sys.exit(main())
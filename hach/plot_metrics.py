@@ -79,7 +79,7 @@ def plot_age(speakers, plotly=False):
     if plotly:
         all_speakers = get_speakers_by_year(speakers)    
     
-        fig = px.histogram(all_speakers, x='age', animation_frame='year', nbins=100, histnorm="percent")
+        fig = px.histogram(all_speakers.astype({'age': float}), x='age', animation_frame='year', nbins=100, histnorm="percent")
         fig.update_layout(title = {
          'text': "Age distribution of climate speakers",
          'x':0.5, 'xanchor': 'center', 'yanchor': 'top'})
@@ -92,14 +92,14 @@ def plot_age(speakers, plotly=False):
             i = (year - 2017) + 1
 
             axs[math.floor(i/3)][1-(i%2)].set_title('Age of speakers in {}'.format(year))
-            axs[math.floor(i/3)][1-(i%2)].hist(speakers[year].age, density=True)
+            axs[math.floor(i/3)][1-(i%2)].hist(speakers[year].age.dropna().astype(int), density=True)
     
 
 
 def top_count(df, attribute, threshold):
     """Helper function for plotting the attribute pie charts (for nationality and political party)"""
     
-    count = df.groupby(attribute).speaker.count().to_frame()
+    count = df.groupby(attribute, observed=True).speaker.count().to_frame()
     count = count.sort_values(by='speaker', ascending=False)
     total_count = count.speaker.sum()
     
@@ -230,7 +230,7 @@ def gender_speach(dfs):
         
         gender_text_i = dfs[year][['gender', 'complexity', 'sentiment_score']]
         gender_text_i = gender_text_i[~gender_text_i.gender.isna()]
-        gender_text_mean_i = gender_text_i.groupby('gender').mean()
+        gender_text_mean_i = gender_text_i.groupby('gender', observed=True).mean()
         gender_text_mean_i = gender_text_mean_i.loc[['male', 'female']].reset_index(drop=False)
         gender_text_mean_i['year'] = year
         
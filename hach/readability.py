@@ -0,0 +1,395 @@
+""" Batch readability module, computing the textstat consensus grade (text_standard) of many quotes at once
+
+The engine reproduces the english tokenization, easy words and formulas of textstat 0.7, its grades being the
+ones of textstat.text_standard for that version only """
+
+# imports
+
+import os
+import re
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import math
+import string
+from collections import Counter, OrderedDict
+from importlib import metadata, resources
+import numpy as np
+import pandas as pd
+from pyphen import Pyphen
+
+# global variables
+
+_punctuation_regex = re.compile(f'[{re.escape(string.punctuation)}]')
+_sentence_regex = re.compile(r' *[\.\?!][\'"\)\]]*[ |\n](?=[A-Z])')
+_word_regex = re.compile(r"[\w\='‘’]+")
+
+_pyphen = Pyphen(lang='en_US')
+
+_easy_words_file = resources.files('textstat') / 'resources/en/easy_words.txt'
+easy_words = {line.strip() for line in _easy_words_file.read_text(encoding='utf-8').splitlines()}
+
+# version of the engine (the textstat 0.7 rules), to change with the tokenization or the formulas
+engine_version = '1'
+
+# syllables of the words seen by the complexity metrics, persisted between the sessions
+word_stats_path = 'data/word_syllables.pkl'
+
+def engine_namespace():
+    """Function naming the engine for the cached grades: its version and the versions of the packages giving
+    the easy words (textstat) and the syllables (pyphen)"""
+
+    return f"readability-{engine_version}/textstat-{metadata.version('textstat')}/pyphen-{metadata.version('pyphen')}"
+
+# word features cache
+
+def _clean_word(word):
+    """Function giving the lowercase word without punctuation, on which the syllables are counted"""
+
+    return _punctuation_regex.sub('', word.lower())
+
+def _count_syllables(clean):
+    """Function counting the syllables of a clean word as textstat.syllable_count"""
+
+    return len(_pyphen.positions(clean)) + 1 if clean else 0
+
+def is_easy(word):
+    """Function telling if a lowercase word (punctuation included, e.g. don't) is in the textstat easy words"""
+
+    return word in easy_words
+
+class WordStatsCache:
+    """Bounded LRU cache of the syllable counts of the words, keyed by the clean word, with hit/miss stats
+
+    Shared by all the complexity metrics of the session (see word_stats), and persistable with
+    save/load so that scoring new quotes only computes the words never seen before"""
+
+    def __init__(self, max_size=1000000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._stats = OrderedDict()
+        # words computed since the last take_new (None when not tracked)
+        self._new = None
+
+    def get(self, clean):
+        """Function giving the syllables of a clean word (see _clean_word), computing them on a miss"""
+
+        syllables = self._stats.get(clean)
+        if syllables is not None:
+            self.hits += 1
+            self._stats.move_to_end(clean)
+            return syllables
+
+        self.misses += 1
+        syllables = _count_syllables(clean)
+        self._stats[clean] = syllables
+        if self._new is not None:
+            self._new[clean] = syllables
+        if len(self._stats) > self.max_size:
+            self._stats.popitem(last=False)
+
+        return syllables
+
+    def syllables(self, word):
+        """Function giving the syllables of a word, punctuation and case being ignored"""
+
+        return self.get(_clean_word(word))
+
+    def track_new(self):
+        """Function starting to keep the words computed from now on (see take_new)"""
+
+        self._new = {}
+
+    def take_new(self):
+        """Function giving the words computed since track_new or the last take_new, and forgetting them"""
+
+        new, self._new = self._new or {}, {}
+
+        return new
+
+    def update(self, words):
+        """Function adding the syllables of the words (a dict of clean word to syllables) to the cache"""
+
+        for clean, syllables in words.items():
+            self._stats[clean] = syllables
+        while len(self._stats) > self.max_size:
+            self._stats.popitem(last=False)
+
+    def save(self, path=word_stats_path):
+        """Function writing the cached words to a pickle"""
+
+        with open(path, 'wb') as f:
+            pickle.dump(list(self._stats.items()), f)
+
+    def load(self, path=word_stats_path):
+        """Function adding the words of a pickle written by save to the cache"""
+
+        with open(path, 'rb') as f:
+            self.update(dict(pickle.load(f)))
+
+    def clear(self):
+        """Function emptying the cache and its stats"""
+
+        self._stats.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        """Proportion of the lookups found in the cache"""
+
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups else 0.
+
+    def __len__(self):
+        return len(self._stats)
+
+    def __repr__(self):
+        return f'WordStatsCache({len(self)}/{self.max_size} words): {self.hits} hits, {self.misses} misses, hit rate {self.hit_rate:.1%}'
+
+# cache used by the complexity metrics
+word_stats = WordStatsCache()
+
+# counting helpers (same tokenization as textstat, english)
+
+def _lexicon_count(text):
+    return len(_punctuation_regex.sub('', text).split())
+
+def _sentence_count(text):
+    sentences = _sentence_regex.split(text)
+    ignored = sum(1 for sentence in sentences if _lexicon_count(sentence) <= 2)
+
+    return max(1, len(sentences) - ignored)
+
+def _quote_counts(text):
+    """Function counting all the quantities needed by the readability formulas, tokenizing the quote once"""
+
+    tokens = text.split()
+    clean = _punctuation_regex.sub('', text.lower())
+
+    # syllables of the whole text (textstat counts one for the empty strings between double spaces)
+    syllables = sum(word_stats.get(part) if part else 1 for part in clean.split(' ')) if clean else 0
+
+    # syllables of each token
+    token_syllables = [word_stats.syllables(token) for token in tokens]
+    polysyllables = sum(1 for count in token_syllables if count >= 3)
+
+    # linsear write on the first 100 tokens
+    linsear_difficult = sum(1 for count in token_syllables[:100] if count >= 3)
+    linsear_easy = min(len(tokens), 100) - linsear_difficult
+    linsear_sentences = _sentence_count(' '.join(tokens[:100]))
+
+    # difficult words (unique, not in the easy words list)
+    hard_words = [word for word in set(_word_regex.findall(text.lower())) if not is_easy(word)]
+    dale_chall_difficult = len(hard_words)
+    fog_difficult = sum(1 for word in hard_words if word_stats.syllables(word) >= 3)
+
+    no_spaces = text.replace(' ', '')
+
+    return (_lexicon_count(text), _sentence_count(text), syllables, polysyllables, len(no_spaces),
+            len(_punctuation_regex.sub('', no_spaces)), linsear_easy, linsear_difficult, linsear_sentences,
+            dale_chall_difficult, fog_difficult)
+
+_count_columns = ['words', 'sentences', 'syllables', 'polysyllables', 'chars', 'letters', 'linsear_easy',
+                  'linsear_difficult', 'linsear_sentences', 'dale_chall_difficult', 'fog_difficult']
+
+def quote_counts(quotes):
+    """Function giving the df of word, sentence, syllable... counts of each quote"""
+
+    return pd.DataFrame([_quote_counts(text) for text in quotes], columns=_count_columns,
+                        index=quotes.index if isinstance(quotes, pd.Series) else None)
+
+# formulas
+
+def _legacy_round(x, points=0):
+    """Vectorized textstat.legacy_round (half away from zero)"""
+
+    p = 10 ** points
+
+    return np.floor((x * p) + np.copysign(0.5, x)) / p
+
+def _divide(a, b):
+    """Function dividing arrays, 0 where b is 0 (textstat's ZeroDivisionError cases)"""
+
+    return np.divide(a, b, out=np.zeros(len(a)), where=b != 0)
+
+def readability_scores(counts):
+    """Function computing the textstat readability formulas used by text_standard from the quote counts"""
+
+    c = {column: counts[column].to_numpy(dtype=float) for column in _count_columns}
+    words, sentences = c['words'], c['sentences']
+    has_words = words != 0
+
+    sentence_length = _legacy_round(_divide(words, sentences), 1)
+    syllables_per_word = _legacy_round(_divide(c['syllables'], words), 1)
+
+    scores = pd.DataFrame(index=counts.index)
+    scores['flesch_kincaid_grade'] = _legacy_round((0.39 * sentence_length) + (11.8 * syllables_per_word) - 15.59, 1)
+    scores['flesch_reading_ease'] = _legacy_round(206.835 - (1.015 * sentence_length) - (84.6 * syllables_per_word), 2)
+
+    smog = _legacy_round((1.043 * (30 * _divide(c['polysyllables'], sentences)) ** .5) + 3.1291, 1)
+    scores['smog_index'] = np.where(sentences >= 3, smog, 0.)
+
+    letters = _legacy_round(_legacy_round(_divide(c['letters'], words), 2) * 100, 2)
+    sentences_100 = _legacy_round(_legacy_round(_divide(sentences, words), 2) * 100, 2)
+    scores['coleman_liau_index'] = _legacy_round((0.058 * letters) - (0.296 * sentences_100) - 15.8, 2)
+
+    ari = _legacy_round((4.71 * _legacy_round(_divide(c['chars'], words), 2)) + (0.5 * _legacy_round(_divide(words, sentences), 2)) - 21.43, 1)
+    scores['automated_readability_index'] = np.where(has_words, ari, 0.)
+
+    difficult = 100 - _divide(words - c['dale_chall_difficult'], words) * 100
+    dale_chall = (0.1579 * difficult) + (0.0496 * sentence_length)
+    dale_chall = _legacy_round(np.where(difficult > 5, dale_chall + 3.6365, dale_chall), 2)
+    scores['dale_chall_readability_score'] = np.where(has_words, dale_chall, 0.)
+
+    linsear = (c['linsear_easy'] * 1 + c['linsear_difficult'] * 3) / c['linsear_sentences']
+    scores['linsear_write_formula'] = np.where(linsear <= 20, linsear - 2, linsear) / 2
+
+    fog = _legacy_round(0.4 * (sentence_length + _divide(c['fog_difficult'], words) * 100), 2)
+    scores['gunning_fog'] = np.where(has_words, fog, 0.)
+
+    return scores
+
+# placeholder for the second reading ease grade, out of the range of the grades
+_no_grade = -10**6
+
+def _reading_ease_grades(score):
+    """Function giving the grade(s) of the flesch reading ease buckets of text_standard (_no_grade when no second grade)"""
+
+    first = np.select([(score < 100) & (score >= 90), (score < 90) & (score >= 80), (score < 80) & (score >= 70),
+                       (score < 70) & (score >= 60), (score < 60) & (score >= 50), (score < 50) & (score >= 40),
+                       (score < 40) & (score >= 30)], [5, 6, 7, 8, 10, 11, 12], default=13)
+    second = np.where((score < 70) & (score >= 60), 9, _no_grade)
+
+    return first, second
+
+def consensus_grade(scores):
+    """Function computing the text_standard consensus grade (most common grade, first one on ties) from the scores"""
+
+    grades = [_legacy_round(scores.flesch_kincaid_grade), np.ceil(scores.flesch_kincaid_grade)]
+    grades.extend(_reading_ease_grades(scores.flesch_reading_ease.to_numpy()))
+    for column in ['smog_index', 'coleman_liau_index', 'automated_readability_index', 'dale_chall_readability_score',
+                   'linsear_write_formula', 'gunning_fog']:
+        grades.append(_legacy_round(scores[column]))
+        grades.append(np.ceil(scores[column]))
+    grades = np.column_stack(grades).astype(np.int64)
+
+    # count of each grade in its row, the missing second reading ease grade never being chosen
+    counts = (grades[:, :, None] == grades[:, None, :]).sum(axis=2)
+    counts[:, 3] = np.where(grades[:, 3] == _no_grade, 0, counts[:, 3])
+
+    # argmax gives the first column of the most common grade, as Counter.most_common
+    return grades[np.arange(len(grades)), counts.argmax(axis=1)].astype(float)
+
+def text_standard(quotes, chunk_size=100000):
+    """Function computing textstat.text_standard(text, float_output=True) for many quotes
+
+    The quotes are tokenized once, the word features being looked up in word_stats, and the formulas
+    and the consensus are computed with numpy. Gives the same grades as textstat (english, pyphen syllables)"""
+
+    index = quotes.index if isinstance(quotes, pd.Series) else None
+    quotes = list(quotes)
+
+    grades = []
+    for i in range(0, len(quotes), chunk_size):
+        counts = quote_counts(quotes[i:i+chunk_size])
+        grades.append(consensus_grade(readability_scores(counts)))
+    grades = np.concatenate(grades) if grades else np.array([], dtype=float)
+
+    return pd.Series(grades, index=index, name='complexity') if index is not None else grades
+
+# single quote
+
+def _round(x, points=0):
+    """Scalar _legacy_round"""
+
+    p = 10 ** points
+
+    return math.floor((x * p) + math.copysign(0.5, x)) / p
+
+_reading_ease_buckets = [(90, 5), (80, 6), (70, 7), (60, 8), (50, 10), (40, 11), (30, 12)]
+
+def _div(a, b):
+    return a / b if b != 0 else 0.
+
+def _quote_grade(counts):
+    """Function computing the consensus grade of one quote from its counts (_quote_counts) with python floats,
+    the same formulas as readability_scores and consensus_grade without the cost of numpy for one row"""
+
+    (words, sentences, syllables, polysyllables, chars, letters, linsear_easy, linsear_difficult, linsear_sentences,
+     dale_chall_difficult, fog_difficult) = counts
+
+    sentence_length = _round(_div(words, sentences), 1)
+    syllables_per_word = _round(_div(syllables, words), 1)
+
+    flesch_kincaid = _round((0.39 * sentence_length) + (11.8 * syllables_per_word) - 15.59, 1)
+    reading_ease = _round(206.835 - (1.015 * sentence_length) - (84.6 * syllables_per_word), 2)
+
+    smog = _round((1.043 * (30 * _div(polysyllables, sentences)) ** .5) + 3.1291, 1) if sentences >= 3 else 0.
+
+    letters_100 = _round(_round(_div(letters, words), 2) * 100, 2)
+    sentences_100 = _round(_round(_div(sentences, words), 2) * 100, 2)
+    coleman_liau = _round((0.058 * letters_100) - (0.296 * sentences_100) - 15.8, 2)
+
+    ari = _round((4.71 * _round(_div(chars, words), 2)) + (0.5 * _round(_div(words, sentences), 2)) - 21.43, 1) if words else 0.
+
+    difficult = 100 - _div(words - dale_chall_difficult, words) * 100
+    dale_chall = (0.1579 * difficult) + (0.0496 * sentence_length)
+    dale_chall = _round(dale_chall + 3.6365 if difficult > 5 else dale_chall, 2) if words else 0.
+
+    linsear = (linsear_easy * 1 + linsear_difficult * 3) / linsear_sentences
+    linsear = (linsear - 2 if linsear <= 20 else linsear) / 2
+
+    fog = _round(0.4 * (sentence_length + _div(fog_difficult, words) * 100), 2) if words else 0.
+
+    # flesch reading ease buckets of _reading_ease_grades
+    ease = next((grade for low, grade in _reading_ease_buckets if low <= reading_ease < low + 10), 13)
+    grades = [_round(flesch_kincaid), math.ceil(flesch_kincaid), ease] + ([9] if 60 <= reading_ease < 70 else [])
+    for score in [smog, coleman_liau, ari, dale_chall, linsear, fog]:
+        grades.extend([_round(score), math.ceil(score)])
+
+    # most common grade, the first one on ties
+    return float(Counter(int(grade) for grade in grades).most_common(1)[0][0])
+
+def quote_standard(text):
+    """Function computing textstat.text_standard(text, float_output=True) for one quote, the words being
+    looked up in word_stats as in text_standard"""
+
+    return _quote_grade(_quote_counts(text))
+
+# parallel scoring
+
+def _init_worker(word_stats_path):
+    """Function warming the word features cache of a worker process with the persisted words"""
+
+    if word_stats_path is not None and os.path.exists(word_stats_path):
+        word_stats.load(word_stats_path)
+    word_stats.track_new()
+
+def _text_standard_shard(texts):
+    # the grades and the words the worker computed for them, merged in the word_stats of the parent
+    return text_standard(texts), word_stats.take_new()
+
+def text_standard_parallel(quotes, n_jobs=None, shard_size=2000, tasks_per_send=4, word_stats_path=word_stats_path):
+    """Function computing text_standard for many quotes on a pool of n_jobs processes (all the cores by default)
+
+    The quotes are cut in shards of shard_size quotes, sent tasks_per_send shards at a time to the workers and
+    put back in order. Each worker starts with the words saved at word_stats_path (if it exists), and sends
+    back the words it computed, which are added to word_stats (see WordStatsCache.save to persist them)"""
+
+    index = quotes.index if isinstance(quotes, pd.Series) else None
+    quotes = list(quotes)
+    shards = [quotes[i:i+shard_size] for i in range(0, len(quotes), shard_size)]
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count(), mp_context=context,
+                             initializer=_init_worker, initargs=(word_stats_path,)) as pool:
+        grades = []
+        for shard_grades, words in pool.map(_text_standard_shard, shards, chunksize=tasks_per_send):
+            grades.append(shard_grades)
+            word_stats.update(words)
+    grades = np.concatenate(grades) if grades else np.array([], dtype=float)
+
+    return pd.Series(grades, index=index, name='complexity') if index is not None else grades
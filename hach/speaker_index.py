@@ -0,0 +1,119 @@
+""" Index of the quotes by speaker and by QID, giving the rows of a speaker without scanning the df """
+
+# imports
+
+import numpy as np
+import pandas as pd
+
+# helpers
+
+def _group_rows(keys):
+    """Function grouping the row positions by key: the unique keys, the positions sorted by key and the start of each key"""
+
+    codes, uniques = pd.factorize(keys)
+    order = np.argsort(codes, kind='stable')
+    # the missing keys (code -1) come first in order, they are skipped
+    starts = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+
+    return np.asarray(uniques, dtype=object), order, starts
+
+# speaker index
+
+class SpeakerIndex:
+    """Row offsets of the quotes of each speaker (canonical name) and of each QID (first QID of the speaker)
+
+    Built once for a df (e.g. by ClimateData.speaker_index) and passed to the lookups of metrics, it gives the
+    rows of a speaker by exact name, by name ignoring the case or by name prefix in a dict lookup or a binary
+    search. The index is not updated when the rows or the speakers of the df change, it must be built again"""
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+
+        self.names, self._order, self._starts = _group_rows(df.speaker.astype(object).to_numpy())
+        self._positions = {name: i for i, name in enumerate(self.names)}
+
+        # lower case names, and sorted for the prefix lookups
+        self._lower_names = np.array([name.lower() for name in self.names], dtype=object)
+        self._lower_order = np.argsort(self._lower_names, kind='stable')
+        self._lower = self._lower_names[self._lower_order]
+
+        if 'qids' in df:
+            self.qids, self._qid_order, self._qid_starts = _group_rows(df.qids.str[0].to_numpy())
+            self._qid_positions = {qid: i for i, qid in enumerate(self.qids)}
+        else:
+            self.qids, self._qid_positions = None, {}
+
+    def _rows(self, i):
+        return self._order[self._starts[i]:self._starts[i+1]]
+
+    def _names_rows(self, names):
+        if not len(names):
+            return np.array([], dtype=np.int64)
+
+        return np.sort(np.concatenate([self._rows(self._positions[name]) for name in names]))
+
+    def rows(self, name):
+        """Function giving the row positions of the quotes of the speaker (in the df order)"""
+
+        i = self._positions.get(name)
+
+        return self._rows(i) if i is not None else np.array([], dtype=np.int64)
+
+    def first_row(self, name):
+        """Function giving the position of the first quote of the speaker (IndexError if no quote)"""
+
+        return self.rows(name)[0]
+
+    def names_like(self, name):
+        """Function giving the names equal to name ignoring the case"""
+
+        return self.names_with_prefix(name, exact=True)
+
+    def names_with_prefix(self, prefix, exact=False):
+        """Function giving the names starting with prefix ignoring the case (equal to it with exact)"""
+
+        prefix = prefix.lower()
+        start = np.searchsorted(self._lower, prefix, side='left')
+        if exact:
+            end = np.searchsorted(self._lower, prefix, side='right')
+        else:
+            end = np.searchsorted(self._lower, prefix + '\U0010ffff', side='left')
+
+        return list(self.names[np.sort(self._lower_order[start:end])])
+
+    def names_containing(self, text):
+        """Function giving the names containing text ignoring the case (a scan of the unique names)"""
+
+        text = text.lower()
+
+        return [name for name, lower in zip(self.names, self._lower_names) if text in lower]
+
+    def lookup(self, name, how='exact'):
+        """Function giving the row positions of the quotes of the speakers matching name (in the df order)
+
+        how is 'exact', 'ignore_case' (same name ignoring the case), 'prefix' (name starting with it, ignoring
+        the case) or 'contains' (name containing it, ignoring the case)"""
+
+        if how == 'exact':
+            return self.rows(name)
+        if how == 'ignore_case':
+            return self._names_rows(self.names_like(name))
+        if how == 'prefix':
+            return self._names_rows(self.names_with_prefix(name))
+        if how == 'contains':
+            return self._names_rows(self.names_containing(name))
+
+        raise ValueError(f"how must be 'exact', 'ignore_case', 'prefix' or 'contains', not {how!r}")
+
+    def qid_rows(self, qid):
+        """Function giving the row positions of the quotes whose speaker has qid as first QID"""
+
+        i = self._qid_positions.get(qid)
+
+        return self._qid_order[self._qid_starts[i]:self._qid_starts[i+1]] if i is not None else np.array([], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f'SpeakerIndex({len(self)} speakers, {self.n_rows} quotes)'
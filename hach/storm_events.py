@@ -0,0 +1,164 @@
+""" Ingestion of the NOAA StormEvents details files into compact typed dfs, cached per year in parquet files """
+
+# imports
+
+import os
+import re
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+# global variables
+
+storm_events_path = 'data/US - Storm Events/'
+
+# parquet files of the ingested details, one per year
+storm_events_store = 'data/storm_events'
+
+years = range(2016, 2021)
+
+# columns kept by default (MONTH, BEGIN_DATE and END_DATE are computed from the source columns)
+storm_columns = ['EVENT_ID', 'YEAR', 'MONTH', 'BEGIN_DATE', 'END_DATE', 'STATE', 'EVENT_TYPE', 'DAMAGE_PROPERTY', 'DAMAGE_CROPS']
+
+_source_columns = {'MONTH': ['BEGIN_YEARMONTH'], 'BEGIN_DATE': ['BEGIN_YEARMONTH', 'BEGIN_DAY', 'BEGIN_TIME'],
+                   'END_DATE': ['END_YEARMONTH', 'END_DAY', 'END_TIME']}
+
+_categorical_columns = ['STATE', 'EVENT_TYPE', 'CZ_TYPE', 'CZ_NAME', 'WFO', 'SOURCE', 'MONTH_NAME']
+
+_integer_columns = {'EVENT_ID': np.int64, 'EPISODE_ID': np.int64, 'YEAR': np.int16, 'INJURIES_DIRECT': np.int32,
+                    'INJURIES_INDIRECT': np.int32, 'DEATHS_DIRECT': np.int32, 'DEATHS_INDIRECT': np.int32}
+
+_damage_columns = ['DAMAGE_PROPERTY', 'DAMAGE_CROPS']
+
+# damages are given as a number followed by an optional unit (2.5K, 1M, 3B, 0, 1.K as float('1.'))
+damage_regex = r'^\s*(\d+\.?\d*|\.\d+)?\s*([KkMmBb]?)\s*$'
+
+_damage_pattern = re.compile(damage_regex)
+
+damage_multipliers = {'': 1., 'K': 1e3, 'M': 1e6, 'B': 1e9}
+
+# helpers
+
+def parse_damages(damages):
+    """Function converting a column of damages (2.5K, 1M, 3B, bare numbers) to float64 numbers, NaN for the missing ones
+
+    The values are parsed once per unique value with one regex extraction, the units being applied with numpy"""
+
+    damages = pd.Series(damages)
+    codes, uniques = pd.factorize(damages)
+
+    # number and unit of each unique value (NaN number for the missing and malformed ones)
+    parts = pd.Series(uniques, dtype=object).astype(str).str.extract(damage_regex)
+    numbers = pd.to_numeric(parts[0], errors='coerce').to_numpy(dtype=np.float64)
+    units = parts[1].fillna('').str.upper()
+    multipliers = np.select([units == unit for unit in damage_multipliers], list(damage_multipliers.values()), np.nan)
+
+    # the -1 code of the missing values takes the appended NaN
+    values = np.append(numbers * multipliers, np.nan)[codes]
+
+    return pd.Series(values, index=damages.index, name=damages.name)
+
+def parse_damage(damage):
+    """Function converting one damage (2.5K, 1M, 3B, bare number) to a float, NaN when missing or malformed
+    (same value as parse_damages, without building a series for one value)"""
+
+    if damage is None or (isinstance(damage, float) and damage != damage):
+        return float('nan')
+
+    match = _damage_pattern.match(str(damage))
+    if match is None or match.group(1) is None:
+        return float('nan')
+
+    return float(match.group(1)) * damage_multipliers[match.group(2).upper()]
+
+def details_files(path=storm_events_path):
+    """Function giving the StormEvents details files of the directory by year"""
+
+    files = {}
+    for name in sorted(os.listdir(path)):
+        match = re.match(r'StormEvents_details.*_d(\d{4})_', name)
+        if match:
+            files[int(match.group(1))] = os.path.join(path, name)
+
+    return files
+
+def _type_chunk(chunk, columns):
+    """Function giving the typed columns of a chunk of a details file"""
+
+    typed = pd.DataFrame(index=chunk.index)
+    for column in columns:
+        if column == 'MONTH':
+            typed[column] = (chunk.BEGIN_YEARMONTH % 100).astype(np.int8)
+        elif column in ('BEGIN_DATE', 'END_DATE'):
+            # from the integer columns (yyyymm, day, hhmm) rather than parsing the date strings
+            yearmonth, day, time = (chunk[source] for source in _source_columns[column])
+            typed[column] = pd.to_datetime(pd.DataFrame({'year': yearmonth // 100, 'month': yearmonth % 100, 'day': day,
+                                                         'hour': time // 100, 'minute': time % 100}))
+        elif column in _damage_columns:
+            typed[column] = parse_damages(chunk[column])
+        elif column in _categorical_columns:
+            typed[column] = chunk[column].astype('category')
+        elif column in _integer_columns:
+            typed[column] = chunk[column].astype(_integer_columns[column])
+        else:
+            typed[column] = chunk[column]
+
+    return typed
+
+def _concat_chunks(chunks):
+    """Function concatenating typed dfs, keeping the categorical columns categorical (union of the categories)"""
+
+    if len(chunks) == 1:
+        return chunks[0]
+
+    df = pd.concat(chunks, ignore_index=True)
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            df[column] = union_categoricals([chunk[column] for chunk in chunks], sort_categories=True)
+
+    return df
+
+def read_details(file, columns=storm_columns, chunksize=100000):
+    """Function reading a gzip details csv in chunks of chunksize rows, keeping and typing only the columns"""
+
+    usecols = {source for column in columns for source in _source_columns.get(column, [column])}
+    dtype = {column: 'category' for column in _categorical_columns if column in usecols}
+
+    reader = pd.read_csv(file, compression='gzip', usecols=sorted(usecols), dtype=dtype, chunksize=chunksize)
+
+    return _concat_chunks([_type_chunk(chunk, columns) for chunk in reader])
+
+# cache
+
+def _cache_path(year, store):
+    return os.path.join(store, f'details_{year}.parquet')
+
+def _cached_columns(year, source, store):
+    """Function giving the columns of the cached year, None if it isn't cached or is older than the source file"""
+
+    path = _cache_path(year, store)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source):
+        return None
+
+    return pq.read_schema(path).names
+
+def load_storm_events(years=years, columns=storm_columns, path=storm_events_path, store=storm_events_store, refresh=False):
+    """Function loading the typed storm events of the years, ingesting each year once and reading the cache afterwards
+
+    Extra columns of the details files (e.g. EPISODE_NARRATIVE) can be added to columns, a year being ingested
+    again when its cache misses one of them or is older than its csv (or with refresh)"""
+
+    files = details_files(path)
+    os.makedirs(store, exist_ok=True)
+
+    dfs = []
+    for year in years:
+        cached = None if refresh else _cached_columns(year, files[year], store)
+        if cached is None or not set(columns) <= set(cached):
+            # the columns already cached are kept
+            ingested = list(cached or []) + [column for column in columns if column not in (cached or [])]
+            read_details(files[year], ingested).to_parquet(_cache_path(year, store), index=False)
+        dfs.append(pd.read_parquet(_cache_path(year, store), columns=list(columns)))
+
+    return _concat_chunks(dfs)
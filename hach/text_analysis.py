@@ -2,8 +2,13 @@
 
 # imports
 
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import pandas as pd
-import textstat
+import flair
+import torch
 from flair.models import TextClassifier
 from flair.data import Sentence
 import seaborn as sns
@@ -16,32 +21,285 @@ import matplotlib.ticker as ticker
 import plotly.express as px
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
+from .cache import ResultCache
+from . import readability
+from .aggregation import monthly_cube
 
 # helpers
 
-def get_sentiment_score(text, classifier): 
-    """Function to get sentiment of a quote using the flair library"""
+def sentiment_cache(db_path='data/text_cache.sqlite'):
+    """Function opening the cache of the sentiment scores (for the current flair version)"""
+    
+    return ResultCache(db_path, f'sentiment/en-sentiment/flair-{flair.__version__}')
+
+def complexity_cache(db_path='data/text_cache.sqlite'):
+    """Function opening the cache of the quote complexities (for the current version of the readability engine)"""
+    
+    return ResultCache(db_path, f'complexity/text_standard/{readability.engine_namespace()}')
+
+def get_sentiment_score(text, classifier, cache=None): 
+    """Function to get sentiment score of a quote using the flair library, negative for a negative sentiment"""
+
+    return get_sentiment_scores([text], classifier, cache=cache)[0]
+
+def load_classifier(device='cpu'):
+    """Function loading the flair sentiment classifier on the given device (cpu by default)"""
+    
+    flair.device = torch.device(device)
+    
+    return TextClassifier.load('en-sentiment')
+
+def _signed_score(sentence):
+    """Function giving the score of the sentiment label of a sentence, negative for a negative sentiment"""
+    
+    if not sentence.labels:
+        # empty quotes get no label
+        return np.nan
+    label = sentence.labels[0]
+    
+    return label.score if label.value == 'POSITIVE' else -label.score
+
+def _score_texts(texts, classifier, batch_size, cache=None):
+    """Function computing the signed sentiment scores of a list of texts, only predicting the ones not in the cache
+    (once per distinct text)"""
+    
+    scores = cache.get_many(texts) if cache is not None else [None] * len(texts)
+    missing_texts = list(dict.fromkeys(text for text, score in zip(texts, scores) if score is None))
+    
+    sentences = [Sentence(text) for text in missing_texts]
+    if sentences:
+        classifier.predict(sentences, mini_batch_size=batch_size)
+    missing_scores = {text: _signed_score(sentence) for text, sentence in zip(missing_texts, sentences)}
+    scores = [missing_scores[text] if score is None else score for text, score in zip(texts, scores)]
+        
+    if cache is not None and missing_texts:
+        cache.put_many(missing_texts, [missing_scores[text] for text in missing_texts])
+        
+    return scores
+
+def get_sentiment_scores(quotes, classifier, batch_size=64, chunk_size=4096, cache=None):
+    """Function computing the signed sentiment score of many quotes, predicted by mini-batches
+    
+    quotes is a df (its quotation column is scored), a series or any iterable of texts. The scores are
+    returned as a series aligned with the df/series, or as an array. The quotes are turned into flair
+    sentences chunk_size at a time to bound the memory. With a cache (see sentiment_cache) only the
+    quotes never scored before are predicted, the cache committing them every commit_every quotes and
+    when closed"""
+    
+    if isinstance(quotes, pd.DataFrame):
+        quotes = quotes.quotation
+    
+    scores = []
+    chunk = []
+    for text in quotes:
+        chunk.append(text)
+        if len(chunk) == chunk_size:
+            scores.extend(_score_texts(chunk, classifier, batch_size, cache))
+            chunk = []
+    if chunk:
+        scores.extend(_score_texts(chunk, classifier, batch_size, cache))
+        
+    scores = np.array(scores, dtype=np.float32)
+    if isinstance(quotes, pd.Series):
+        return pd.Series(scores, index=quotes.index, name='sentiment_score')
+    
+    return scores
 
-    sentence = Sentence(text)
-    classifier.predict(sentence)
-    return sentence.labels
+# classifier of each sentiment worker process
+_worker_classifier = None
+
+def _init_sentiment_worker(torch_threads):
+    """Function loading the classifier once in a worker process"""
+    
+    global _worker_classifier
+    torch.set_num_threads(torch_threads)
+    _worker_classifier = load_classifier()
+
+def _score_shard(texts, batch_size):
+    """Function scoring a shard of quotes in a worker process"""
+    
+    return get_sentiment_scores(texts, _worker_classifier, batch_size)
+
+def get_sentiment_scores_parallel(quotes, n_jobs=None, torch_threads=1, batch_size=64, shard_size=2048, cache=None):
+    """Function computing the signed sentiment score of many quotes on a pool of processes
+    
+    Each of the n_jobs workers (by default as many as fit in the cores with torch_threads each) loads
+    the classifier once and scores shards of shard_size quotes, the scores being put back in order.
+    The cache is only used by this process: the cached quotes are not sent to the workers.
+    Returns the same as get_sentiment_scores"""
+    
+    if isinstance(quotes, pd.DataFrame):
+        quotes = quotes.quotation
+    n_jobs = n_jobs or max(1, os.cpu_count() // torch_threads)
+    
+    texts = list(quotes)
+    cached = cache.get_many(texts) if cache is not None else [None] * len(texts)
+    missing = [i for i, score in enumerate(cached) if score is None]
+    # each distinct text is only scored once
+    missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+    shards = [missing_texts[i:i+shard_size] for i in range(0, len(missing_texts), shard_size)]
+    
+    # spawned workers, torch doesn't support being forked after its threads started
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context, 
+                             initializer=_init_sentiment_worker, initargs=(torch_threads,)) as pool:
+        missing_scores = list(pool.map(_score_shard, shards, repeat(batch_size)))
+        
+    missing_scores = np.concatenate(missing_scores) if missing_scores else np.array([], dtype=np.float32)
+    if cache is not None and missing:
+        cache.put_many(missing_texts, missing_scores)
+    
+    scores = np.array(cached, dtype=np.float32)
+    positions = {text: i for i, text in enumerate(missing_texts)}
+    scores[missing] = missing_scores[[positions[texts[i]] for i in missing]]
+    if isinstance(quotes, pd.Series):
+        return pd.Series(scores, index=quotes.index, name='sentiment_score')
+    
+    return scores
+
+def score_sentiment(df, classifier, labels=False, n_jobs=1, **kwargs):
+    """Function adding the float32 sentiment_score column to df (negative for a negative sentiment)
+    
+    With labels, also adds the sentiment_label (POSITIVE/NEGATIVE) and sentiment_confidence columns.
+    n_jobs != 1 scores on a pool of processes, the other arguments are passed to get_sentiment_scores(_parallel)"""
+    
+    if n_jobs == 1:
+        df['sentiment_score'] = get_sentiment_scores(df.quotation, classifier, **kwargs)
+    else:
+        df['sentiment_score'] = get_sentiment_scores_parallel(df.quotation, n_jobs, **kwargs)
+        
+    if labels:
+        sentiment_labels(df)
+        
+def sentiment_labels(df):
+    """Function adding the sentiment_label and sentiment_confidence columns from the sentiment_score"""
+    
+    label = np.where(df.sentiment_score >= 0, 'POSITIVE', 'NEGATIVE')
+    df['sentiment_label'] = pd.Categorical(label, categories=['NEGATIVE', 'POSITIVE'])
+    df['sentiment_label'] = df.sentiment_label.where(df.sentiment_score.notna())
+    df['sentiment_confidence'] = df.sentiment_score.abs().astype(np.float32)
 
 def sentiment_mapping(df): 
-    """Function mapping the sentiment to a sentiment score, where negative sentiments map to negative values"""
+    """Function mapping the sentiment to a sentiment score, where negative sentiments map to negative values
+    
+    Nothing to compute for dfs scored with score_sentiment or with numeric sentiments, the flair
+    labels of older pickles (e.g. [POSITIVE (0.9989)]) are parsed as strings"""
+    
+    if 'sentiment' not in df:
+        return
+    
+    if pd.api.types.is_numeric_dtype(df.sentiment):
+        df['sentiment_score'] = df.sentiment.astype(np.float32)
+    else:
+        labels = df.sentiment.astype(str)
+        score = labels.str[11:-2].astype(np.float32)
+        df['sentiment_score'] = score.where(labels.str[1] == 'P', -score)
     
-    df['sentiment_score'] = df.sentiment.apply(lambda x: float(str(x)[11:-2]) if str(x)[1] == 'P' else -float(str(x)[11:-2]))
     
+def get_quote_complexity(text, cache=None):
+    """Function computing the language complexity of a quote base on the textstat library
     
-def get_quote_complexity(text):
-    """Function computing the language complexity of a quote base on the textstat library"""
+    Computed with the readability engine (same value as textstat.text_standard), sharing its word features
+    cache (readability.word_stats) with the other metrics. With a cache (see complexity_cache) the complexity is only computed for new quotes"""
     
-    return textstat.text_standard(text, float_output=True)
+    if cache is not None:
+        complexity = cache.get(text)
+        if complexity is not None:
+            return complexity
+        
+    complexity = readability.quote_standard(text)
+    
+    if cache is not None:
+        cache.put(text, complexity)
+    
+    return complexity
+
+def get_quotes_complexity(quotes, cache=None):
+    """Function computing the language complexity of many quotes at once (same values as get_quote_complexity)
+    
+    quotes is a df (its quotation column is used), a series or a list of texts, see readability.text_standard"""
+    
+    if isinstance(quotes, pd.DataFrame):
+        quotes = quotes.quotation
+    texts = list(quotes)
+    
+    complexities = cache.get_many(texts) if cache is not None else [None] * len(texts)
+    missing = [i for i, complexity in enumerate(complexities) if complexity is None]
+    missing_texts = [texts[i] for i in missing]
+    
+    missing_complexities = readability.text_standard(missing_texts)
+    if cache is not None and missing:
+        cache.put_many(missing_texts, missing_complexities)
+        cache.commit()
+        
+    complexities = np.array(complexities, dtype=float)
+    complexities[missing] = missing_complexities
+    if isinstance(quotes, pd.Series):
+        return pd.Series(complexities, index=quotes.index, name='complexity')
+    
+    return complexities
+
+def score_complexity(dfs, n_jobs=None, cache=None, word_stats_path=readability.word_stats_path, **kwargs):
+    """Function adding the complexity column to each df of the dict of yearly dfs (e.g. from get_climate_data)
+    
+    The quotes of all the years are scored together on a pool of n_jobs processes, see readability.text_standard_parallel
+    for the other arguments. With a cache (see complexity_cache) only the new quotes are sent to the pool. The syllables
+    of the words are read from and saved to word_stats_path (None to not persist them)"""
+    
+    if word_stats_path is not None and os.path.exists(word_stats_path):
+        readability.word_stats.load(word_stats_path)
+    
+    years = list(dfs.keys())
+    texts = {year: dfs[year].quotation.tolist() for year in years}
+    all_texts = [text for year in years for text in texts[year]]
+    
+    complexities = cache.get_many(all_texts) if cache is not None else [None] * len(all_texts)
+    missing = [i for i, complexity in enumerate(complexities) if complexity is None]
+    missing_texts = [all_texts[i] for i in missing]
+    
+    missing_complexities = readability.text_standard_parallel(missing_texts, n_jobs, word_stats_path=word_stats_path, **kwargs)
+    if cache is not None and missing:
+        cache.put_many(missing_texts, missing_complexities)
+        cache.commit()
+    if word_stats_path is not None:
+        # with the words computed by the workers
+        readability.word_stats.save(word_stats_path)
+        
+    complexities = np.array(complexities, dtype=float)
+    complexities[missing] = missing_complexities
+    
+    # back to the dfs, in the order of the years
+    start = 0
+    for year in years:
+        df = dfs[year]
+        df['complexity'] = complexities[start:start + len(df)]
+        # reassigned for the dict-likes giving copies (ClimateData)
+        dfs[year] = df
+        start += len(df)
+        
+    return dfs
 
 def month_mapping(df): 
     """Function creating a new month column based on the quote ID"""
     
     df['month'] = df.quoteID.str.slice(start= 5, stop=7)
     
+def monthly_average(data, measure):
+    """Function giving the monthly average of the measure, data being quotes (aggregated with monthly_cube)
+    or a monthly average already taken from a MonthlyCube (e.g. cube.mean(measure, 'political_party', party, year))"""
+    
+    if not isinstance(data, pd.Series):
+        data = monthly_cube(data, groups=[], measures=[measure]).mean(measure)
+    
+    # months of one year are shown as '01'...'12' as before, otherwise as dates
+    months = data.index
+    if len(months) and (months.year == months.year[0]).all():
+        data = pd.Series(data.values, index=months.strftime('%m'))
+    else:
+        data = pd.Series(data.values, index=months.to_timestamp())
+    
+    return data.round(2)
+    
 # plots
     
 def plot_months(df, title): 
@@ -73,10 +331,10 @@ def plot_sentiment_months(df):
 def plot_top_parties(df):
     """Function to plot complexity and sentiment of top 10 parties in df"""
     
-    top_10_parties = df.groupby('political_party')['quoteID'].count().sort_values(ascending=False).head(10).to_frame()
+    top_10_parties = df.groupby('political_party', observed=True)['quoteID'].count().sort_values(ascending=False).head(10).to_frame()
     data = df[df['political_party'].apply(lambda x: x in top_10_parties.index)]
-    average_complexity = data.groupby('political_party')['complexity'].mean().round(2)
-    average_sentiment = data.groupby('political_party')['sentiment_score'].mean().round(2)
+    average_complexity = data.groupby('political_party', observed=True)['complexity'].mean().round(2)
+    average_sentiment = data.groupby('political_party', observed=True)['sentiment_score'].mean().round(2)
 
     fig = sns.pointplot(x=average_complexity, y=average_sentiment, hue=top_10_parties.index)
     plt.xticks(rotation=70)
@@ -85,33 +343,30 @@ def plot_top_parties(df):
     plt.show()
      
 def plot_complexity_evolution(df, title_text):
-    """Function to plot average complexity """
+    """Function to plot average complexity (df being quotes or a monthly average of a MonthlyCube)"""
     
-    month_mapping(df)
-    monthly_average = df.groupby('month')['complexity'].mean().round(2)
-    fig = sns.lineplot(x=monthly_average.index, y= monthly_average.values)
+    average = monthly_average(df, 'complexity')
+    fig = sns.lineplot(x=average.index, y= average.values)
     fig.set(ylabel='average quote complexity')  
     plt.title(title_text)
 
     
 def plot_sentiment_evolution(df, title_text):
-    """Function to plot average sentiment """
+    """Function to plot average sentiment (df being quotes or a monthly average of a MonthlyCube)"""
     
-    month_mapping(df)
-    monthly_average = df.groupby('month')['sentiment_score'].mean().round(2)
-    fig = sns.lineplot(x=monthly_average.index, y= monthly_average.values)
+    average = monthly_average(df, 'sentiment_score')
+    fig = sns.lineplot(x=average.index, y= average.values)
     fig.set(ylabel='average quote sentiment')  
     plt.title(title_text)
 
 def plot_comparison_sentiment(dfs, title_text, labels):
-    """Function to compare language sentiment of two sets over time"""
+    """Function to compare language sentiment of two sets over time (quotes or monthly averages of a MonthlyCube)"""
     
-    monthly_average= {}
+    averages = {}
     
     for i in range(1, 3):
-        month_mapping(dfs[i])
-        monthly_average[i] = dfs[i].groupby('month')['sentiment_score'].mean().round(2)
-        fig = sns.lineplot(x=monthly_average[i].index, y= monthly_average[i].values)
+        averages[i] = monthly_average(dfs[i], 'sentiment_score')
+        fig = sns.lineplot(x=averages[i].index, y= averages[i].values)
                       
     fig.set(ylabel='average quote sentiment') 
     plt.legend(labels=labels)
@@ -122,12 +377,11 @@ def plot_comparison_sentiment(dfs, title_text, labels):
 def plot_comparison_complexity(dfs, title_text, labels): 
     """Function to compare language sentiment of two sets over time"""
     
-    monthly_average= {}
+    averages = {}
     
     for i in range(1, 3):
-        month_mapping(dfs[i])
-        monthly_average[i] = dfs[i].groupby('month')['complexity'].mean().round(2)
-        fig = sns.lineplot(x=monthly_average[i].index, y= monthly_average[i].values)
+        averages[i] = monthly_average(dfs[i], 'complexity')
+        fig = sns.lineplot(x=averages[i].index, y= averages[i].values)
         
     fig.set(ylabel='average quote complexity')  
     plt.title(title_text)